@@ -0,0 +1,241 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import LDPlatform
+
+DEFAULT_MAX_IN_FLIGHT = 8
+
+# LDPlatform methods that talk to the API, exposed as coroutines. patch_flag
+# and flush_flag_patches are left out: flag patch batches are per thread,
+# and each call may run on a different worker of the pool
+ASYNC_METHODS = (
+    "create_project",
+    "create_environment",
+    "get_environment_keys",
+    "delete_project",
+    "update_resource",
+    "delete_resource",
+    "create_flag",
+    "update_flag_client_side_availability",
+    "copy_flag_settings",
+    "create_ai_config",
+    "create_ai_config_versions",
+    "create_ai_agent",
+    "create_ai_agent_variations_bulk",
+    "create_ai_agent_variation",
+    "create_custom_model_config",
+    "create_segment",
+    "add_segment_rule",
+    "create_metric",
+    "create_metric_group",
+    "create_context",
+    "create_experiment",
+    "create_holdout",
+    "create_layer",
+    "update_layer",
+    "create_release_pipeline",
+    "create_shortcut",
+    "get_user_id",
+    "lookup_user_id",
+    "project_exists",
+    "get_project",
+    "list_projects",
+    "patch_project",
+    "create_user",
+    "flag_exists",
+    "segment_exists",
+    "metric_exists",
+    "metric_group_exists",
+    "experiment_exists",
+    "release_pipeline_exists",
+    "get_flag_entry",
+    "get_flag_variation_values",
+    "get_flag_variation_names",
+    "get_flag_variation_details",
+    "get_flag_variations",
+    "get_treatments",
+    "add_guarded_rollout",
+    "add_progressive_rollout",
+    "toggle_flag",
+    "add_maintainer_to_flag",
+    "add_maintainer_to_metric",
+    "add_maintainer_to_ai_config",
+    "assign_maintainers",
+    "add_segment_to_flag",
+    "add_prerequisite_to_flag",
+    "start_exp_iteration",
+    "add_pipeline_flag",
+    "add_pipeline_flags",
+    "get_flag_release",
+    "get_pipeline_phase_ids",
+    "attach_metric_to_flag",
+    "advance_flag_phase",
+    "update_ai_config_targeting",
+    "toggle_ai_config",
+    "get_ai_config_variation_id",
+    "fetch_ai_config",
+    "add_ai_agent_guarded_rollout",
+    "get_ai_config_variations",
+    "create_alert",
+)
+
+# Methods that change the platform's project state: the project key, the
+# environment's client-side ID and SDK key, the member ID and the caches of
+# the project. Each runs on its own, once the calls before it have finished,
+# and no other call starts until it is done
+EXCLUSIVE_METHODS = {"create_project", "delete_project", "get_environment_keys", "get_user_id"}
+
+
+class AsyncLDPlatform:
+    """
+    LDPlatform's methods as coroutines, for callers running on an asyncio
+    event loop. This is a thread-offload wrapper, not an asyncio HTTP
+    client: requests has no asyncio transport, so each call runs the
+    blocking LDPlatform method on a worker pool sized to max_in_flight, and
+    the loop only awaits the result. Those calls share one keep-alive
+    connection pool, rate limiter and retry policy. Calls that change the
+    project state (EXCLUSIVE_METHODS) are never in flight alongside other
+    calls, e.g.
+
+        async with await AsyncLDPlatform.create(api_key, api_key_user, email) as ld:
+            ld.project_key = project_key
+            await asyncio.gather(
+                ld.create_metric("cart-total", "Cart Total", "cart-total"),
+                ld.create_segment("beta", "Beta Users", "production"),
+            )
+    """
+
+    def __init__(self, platform, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        self.platform = platform
+        self.max_in_flight = max_in_flight
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix="ldplatform"
+        )
+        # Created on first use, on the loop the calls run on
+        self.state = None
+        self.in_flight = 0
+        self.exclusive = False
+        self.exclusive_waiting = 0
+
+    @classmethod
+    async def create(cls, api_key, api_key_user, email, max_in_flight=DEFAULT_MAX_IN_FLIGHT, **kwargs):
+        """Build the underlying LDPlatform (which looks up the member ID) off the loop."""
+        loop = asyncio.get_running_loop()
+        # One pooled connection per request that can be in flight
+        kwargs.setdefault("pool_size", max_in_flight)
+        platform = await loop.run_in_executor(
+            None,
+            functools.partial(LDPlatform.LDPlatform, api_key, api_key_user, email, **kwargs),
+        )
+        return cls(platform, max_in_flight)
+
+    ##################################################
+    # Shared project state
+    ##################################################
+    @property
+    def project_key(self):
+        return self.platform.project_key
+
+    @project_key.setter
+    def project_key(self, value):
+        if self.in_flight:
+            raise RuntimeError("project_key changed while calls are in flight")
+        self.platform.project_key = value
+
+    @property
+    def client_id(self):
+        return self.platform.client_id
+
+    @property
+    def sdk_key(self):
+        return self.platform.sdk_key
+
+    @property
+    def user_id(self):
+        return self.platform.user_id
+
+    ##################################################
+    # Payload helpers (no I/O, so not coroutines)
+    ##################################################
+    def treatment(self, name, baseline, allocation_percent, flag_key, variation_id):
+        return self.platform.treatment(name, baseline, allocation_percent, flag_key, variation_id)
+
+    def exp_metric(self, key, is_group=True):
+        return self.platform.exp_metric(key, is_group)
+
+    def get_exp_metrics(self, metric_list):
+        return self.platform.get_exp_metrics(metric_list)
+
+    ##################################################
+    # Running calls
+    ##################################################
+    async def call(self, fn, *args, exclusive=False, **kwargs):
+        """
+        Run a blocking LDPlatform call on the bounded worker pool. An
+        exclusive call waits for the calls in flight and holds back new
+        ones until it is done.
+        """
+        loop = asyncio.get_running_loop()
+        await self.begin(exclusive)
+        try:
+            return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            await self.end(exclusive)
+
+    async def begin(self, exclusive):
+        if self.state is None:
+            self.state = asyncio.Condition()
+        async with self.state:
+            if exclusive:
+                self.exclusive_waiting += 1
+                await self.state.wait_for(lambda: not self.exclusive and self.in_flight == 0)
+                self.exclusive_waiting -= 1
+                self.exclusive = True
+            else:
+                # Waiting exclusive calls go first, so they are not starved
+                await self.state.wait_for(lambda: not self.exclusive and not self.exclusive_waiting)
+            self.in_flight += 1
+
+    async def end(self, exclusive):
+        async with self.state:
+            self.in_flight -= 1
+            if exclusive:
+                self.exclusive = False
+            self.state.notify_all()
+
+    async def gather(self, *coros, return_exceptions=False):
+        return await asyncio.gather(*coros, return_exceptions=return_exceptions)
+
+    def close(self):
+        """Blocking close, for use outside the event loop."""
+        self.executor.shutdown(wait=True)
+        self.platform.close()
+
+    async def aclose(self):
+        # Waiting for the workers to finish must not block the loop
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.executor.shutdown)
+        self.platform.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+
+def _coroutine_method(name):
+    exclusive = name in EXCLUSIVE_METHODS
+
+    async def method(self, *args, **kwargs):
+        return await self.call(getattr(self.platform, name), *args, exclusive=exclusive, **kwargs)
+
+    method.__name__ = name
+    method.__qualname__ = "AsyncLDPlatform." + name
+    method.__doc__ = "Coroutine version of LDPlatform." + name + "."
+    return method
+
+
+for _name in ASYNC_METHODS:
+    setattr(AsyncLDPlatform, _name, _coroutine_method(_name))
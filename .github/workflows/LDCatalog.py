@@ -0,0 +1,209 @@
+import threading
+
+import LDTransport
+
+
+##################################################
+# Compact flag records
+##################################################
+class FlagVariation:
+    __slots__ = ("id", "name", "value", "ordinal")
+
+    def __init__(self, id, name, value, ordinal):
+        self.id = id
+        self.name = name
+        self.value = value
+        self.ordinal = ordinal
+
+
+class FlagEntry:
+    __slots__ = ("key", "variations", "on_variation", "off_variation")
+
+    def __init__(self, key, variations, on_variation=0, off_variation=0):
+        self.key = key
+        self.variations = variations
+        self.on_variation = on_variation
+        self.off_variation = off_variation
+
+    @classmethod
+    def from_flag(cls, data):
+        """Build an entry from a flag representation, or None if it has no variation IDs."""
+        if "key" not in data or "variations" not in data:
+            return None
+        variations = []
+        for ordinal, var in enumerate(data["variations"]):
+            if "_id" not in var:
+                return None
+            variations.append(
+                FlagVariation(var["_id"], var.get("name"), var.get("value"), ordinal)
+            )
+        defaults = data.get("defaults") or {}
+        return cls(
+            data["key"],
+            tuple(variations),
+            defaults.get("onVariation", 0),
+            defaults.get("offVariation", 0),
+        )
+
+
+##################################################
+# Per-project flag catalog
+##################################################
+class FlagCatalog:
+    """
+    Flag key -> ordered variations and defaults for the platform's project.
+    Seeded from the flag representations returned by flag creates and
+    patches, so variation lookups need no request once a flag is known.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flags = {}
+
+    def seed(self, data):
+        entry = FlagEntry.from_flag(data) if isinstance(data, dict) else None
+        if entry is not None:
+            with self.lock:
+                self.flags[entry.key] = entry
+        return entry
+
+    def get(self, flag_key):
+        with self.lock:
+            return self.flags.get(flag_key)
+
+    def remove(self, flag_key):
+        with self.lock:
+            self.flags.pop(flag_key, None)
+
+    def clear(self):
+        with self.lock:
+            self.flags.clear()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.flags)
+
+
+##################################################
+# Compact AI config variation records
+##################################################
+class AIConfigVariation:
+    __slots__ = ("id", "key", "name")
+
+    def __init__(self, id, key, name):
+        self.id = id
+        self.key = key
+        self.name = name
+
+    def as_dict(self):
+        return {"_id": self.id, "key": self.key, "name": self.name}
+
+
+class AIConfigEntry:
+    __slots__ = ("key", "variations", "complete")
+
+    def __init__(self, key):
+        self.key = key
+        # Variation key -> record, in creation order
+        self.variations = {}
+        # True once the entry holds every variation of the config, i.e. it
+        # was seeded from a full config representation
+        self.complete = False
+
+
+##################################################
+# Per-project AI config variation index
+##################################################
+class AIConfigCatalog:
+    """
+    AI config key -> variation key -> (_id, key, name). Seeded from the
+    responses to config and variation creates, so variation lookups skip
+    downloading the config with all of its prompt messages.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.configs = {}
+
+    def seed_config(self, data):
+        """Index a full AI config representation."""
+        if not isinstance(data, dict) or "key" not in data:
+            return None
+        if "variations" not in data:
+            # Nothing to index, but keep any variations seen so far
+            with self.lock:
+                return self.configs.setdefault(data["key"], AIConfigEntry(data["key"]))
+        entry = AIConfigEntry(data["key"])
+        for variation in data["variations"]:
+            if "key" in variation and "_id" in variation:
+                entry.variations[variation["key"]] = AIConfigVariation(
+                    variation["_id"], variation["key"], variation.get("name", "")
+                )
+        entry.complete = True
+        with self.lock:
+            self.configs[entry.key] = entry
+        return entry
+
+    def add_variation(self, config_key, data):
+        """Index a variation returned by a variation create."""
+        if not isinstance(data, dict) or "key" not in data or "_id" not in data:
+            return None
+        variation = AIConfigVariation(data["_id"], data["key"], data.get("name", ""))
+        with self.lock:
+            entry = self.configs.setdefault(config_key, AIConfigEntry(config_key))
+            entry.variations[variation.key] = variation
+        return variation
+
+    def variation(self, config_key, variation_key):
+        with self.lock:
+            entry = self.configs.get(config_key)
+            return entry.variations.get(variation_key) if entry is not None else None
+
+    def variations(self, config_key):
+        """All variations of a config, or None unless the index holds every one."""
+        with self.lock:
+            entry = self.configs.get(config_key)
+            if entry is None or not entry.complete:
+                return None
+            return list(entry.variations.values())
+
+    def clear(self):
+        with self.lock:
+            self.configs.clear()
+
+
+##################################################
+# Account-wide member ID lookups
+##################################################
+class MemberDirectory:
+    """
+    Email -> member ID, shared by the LDPlatforms of every project built for
+    the same account so each member is looked up once. Concurrent lookups
+    of the same email wait for the first one, and a lookup that finds no
+    member (None) is not remembered.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.members = {}
+        self.lookups = LDTransport.SingleFlight()
+        self.hits = 0
+
+    def get(self, email, lookup):
+        with self.lock:
+            if email in self.members:
+                self.hits += 1
+                return self.members[email]
+
+        def load():
+            member_id = lookup()
+            if member_id is not None:
+                with self.lock:
+                    self.members[email] = member_id
+            return member_id
+
+        return self.lookups.do(email, load)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.members)
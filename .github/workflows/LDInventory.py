@@ -0,0 +1,225 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import LDScheduler
+import LDTransport
+
+API_URL = "https://app.launchdarkly.com/api/v2"
+
+# List endpoint, single resource endpoint, page size and API version for each
+# resource type. {project} and {env} are filled in from the platform's project
+# and the requested environment.
+RESOURCE_TYPES = {
+    "flags": {
+        "path": "/flags/{project}?summary=true",
+        "item": "/flags/{project}/{key}",
+        "limit": 100,
+        "beta": False,
+    },
+    "metrics": {
+        "path": "/metrics/{project}",
+        "item": "/metrics/{project}/{key}",
+        "limit": 100,
+        "beta": False,
+    },
+    "segments": {
+        "path": "/segments/{project}/{env}",
+        "item": "/segments/{project}/{env}/{key}",
+        "limit": 50,
+        "beta": False,
+    },
+    "metric-groups": {
+        "path": "/projects/{project}/metric-groups",
+        "item": "/projects/{project}/metric-groups/{key}",
+        "limit": 50,
+        "beta": True,
+    },
+    "experiments": {
+        "path": "/projects/{project}/environments/{env}/experiments",
+        "item": "/projects/{project}/environments/{env}/experiments/{key}",
+        "limit": 50,
+        "beta": True,
+    },
+    "release-pipelines": {
+        "path": "/projects/{project}/release-pipelines",
+        "item": "/projects/{project}/release-pipelines/{key}",
+        "limit": 50,
+        "beta": True,
+    },
+    "ai-configs": {
+        "path": "/projects/{project}/ai-configs",
+        "item": "/projects/{project}/ai-configs/{key}",
+        "limit": 50,
+        "beta": True,
+    },
+}
+
+
+def resource_url(resource_type, project_key, key, env_key=None):
+    """URL of a single resource, for updates and deletes."""
+    spec = RESOURCE_TYPES[resource_type]
+    return API_URL + spec["item"].format(project=project_key, env=env_key, key=key)
+
+
+class ProjectInventory:
+    """
+    In-memory index of the resources in the platform's project. Each resource
+    type (per environment, where the type is environment scoped) is pulled
+    once from its paginated list endpoint, then kept current from create
+    responses, so existence checks are answered without a request.
+    """
+
+    def __init__(self, platform):
+        self.platform = platform
+        self.lock = threading.Lock()
+        self.indexes = {}
+        # Resources created or removed while a scope was not loaded, applied
+        # on top of the list fetch so a load racing a create cannot miss it
+        self.changes = {}
+        self.loads = LDTransport.SingleFlight()
+
+    def reset(self):
+        with self.lock:
+            self.indexes.clear()
+            self.changes.clear()
+
+    ##################################################
+    # Loading
+    ##################################################
+    def list_url(self, resource_type, env_key=None, offset=0):
+        spec = RESOURCE_TYPES[resource_type]
+        path = spec["path"].format(project=self.platform.project_key, env=env_key)
+        separator = "&" if "?" in path else "?"
+        return (
+            API_URL
+            + path
+            + separator
+            + "limit="
+            + str(spec["limit"])
+            + "&offset="
+            + str(offset)
+        )
+
+    def fetch(self, resource_type, env_key=None):
+        """
+        Page through the list endpoint and return {key: item}. Raises
+        RuntimeError when a page cannot be read, since a partial list would
+        be taken for the whole project.
+        """
+        spec = RESOURCE_TYPES[resource_type]
+        headers = {"Authorization": self.platform.api_key}
+        if spec["beta"]:
+            headers["LD-API-Version"] = "beta"
+
+        items = {}
+        offset = 0
+        while True:
+            res = self.platform.getrequest(
+                "GET", self.list_url(resource_type, env_key, offset), headers=headers, cache=False
+            )
+            if res.status_code != 200:
+                raise RuntimeError(f"Unable to list {resource_type}: HTTP {res.status_code}")
+            data = res.json()
+            page = data.get("items", [])
+            for item in page:
+                if "key" in item:
+                    items[item["key"]] = item
+            offset += len(page)
+            total = data.get("totalCount")
+            has_next = "next" in data.get("_links", {})
+            if not page or (total is not None and offset >= total) or (total is None and not has_next):
+                break
+        return items
+
+    def index(self, resource_type, env_key=None):
+        """
+        Return the {key: item} index for a resource type, loading it on
+        first use. A load that fails is not kept, so the next use retries it.
+        """
+        scope = (resource_type, env_key)
+        with self.lock:
+            if scope in self.indexes:
+                return self.indexes[scope]
+
+        def load():
+            with self.lock:
+                if scope in self.indexes:
+                    return self.indexes[scope]
+            items = self.fetch(resource_type, env_key)
+            with self.lock:
+                for key, item in self.changes.pop(scope, {}).items():
+                    if item is None:
+                        items.pop(key, None)
+                    else:
+                        items[key] = item
+                return self.indexes.setdefault(scope, items)
+
+        return self.loads.do(scope, load)
+
+    def details(self, resource_type, keys, env_key=None, max_workers=4):
+        """
+        {key: item} of the single-resource reads of keys, fetched
+        concurrently. List entries leave out what reconciling compares, such
+        as a flag's rules, prerequisites and fallthrough, or a segment's
+        rules. A resource deleted since it was listed is left out. Raises
+        RuntimeError when one cannot be read.
+        """
+        headers = {"Authorization": self.platform.api_key}
+        if RESOURCE_TYPES[resource_type]["beta"]:
+            headers["LD-API-Version"] = "beta"
+
+        def read(key):
+            res = self.platform.getrequest(
+                "GET", resource_url(resource_type, self.platform.project_key, key, env_key), headers=headers, cache=False
+            )
+            if res.status_code == 404:
+                return None
+            if res.status_code != 200:
+                raise RuntimeError(f"Unable to read {resource_type} {key}: HTTP {res.status_code}")
+            return res.json()
+
+        keys = list(keys)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            items = list(executor.map(LDScheduler.in_current_task(read), keys))
+        return {key: item for key, item in zip(keys, items) if item is not None}
+
+    def preload(self, scopes, max_workers=4):
+        """Load several (resource_type, env_key) scopes concurrently."""
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(LDScheduler.in_current_task(lambda scope: self.index(*scope)), scopes))
+
+    ##################################################
+    # Lookups and updates
+    ##################################################
+    def contains(self, resource_type, key, env_key=None):
+        index = self.index(resource_type, env_key)
+        with self.lock:
+            return key in index
+
+    def get(self, resource_type, key, env_key=None):
+        index = self.index(resource_type, env_key)
+        with self.lock:
+            return index.get(key)
+
+    def keys(self, resource_type, env_key=None):
+        index = self.index(resource_type, env_key)
+        with self.lock:
+            return list(index)
+
+    def add(self, resource_type, key, item=None, env_key=None):
+        """Record a resource we just created. Unloaded scopes are left to load lazily."""
+        item = item if item is not None else {"key": key}
+        with self.lock:
+            index = self.indexes.get((resource_type, env_key))
+            if index is not None:
+                index[key] = item
+            else:
+                self.changes.setdefault((resource_type, env_key), {})[key] = item
+
+    def remove(self, resource_type, key, env_key=None):
+        with self.lock:
+            index = self.indexes.get((resource_type, env_key))
+            if index is not None:
+                index.pop(key, None)
+            else:
+                self.changes.setdefault((resource_type, env_key), {})[key] = None
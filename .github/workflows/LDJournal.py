@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_DIRECTORY = ".ld-journal"
+
+
+def digest(spec):
+    """Stable hash of the payload a build step applies."""
+    data = json.dumps(spec, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+##################################################
+# Append-only record of completed build steps
+##################################################
+class BuildJournal:
+    """
+    One JSON line per completed build step, with a hash of what the step
+    set up. A build that dies part way leaves the journal behind, and the
+    next build skips every step recorded with an unchanged hash instead of
+    recreating the project. A build that completes empties its journal.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # Step name -> hash of its spec when it completed
+        self.done = {}
+
+    @classmethod
+    def for_project(cls, project_key, directory=DEFAULT_DIRECTORY):
+        return cls(os.path.join(directory, project_key + ".jsonl"))
+
+    def load(self):
+        self.done = {}
+        if not os.path.exists(self.path):
+            return self.done
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut short by the crash being recovered from
+                    continue
+                self.done[record["node"]] = record["digest"]
+        return self.done
+
+    def completed(self, name, spec):
+        return self.done.get(name) == digest(spec)
+
+    def record(self, task):
+        line = json.dumps({"node": task.name, "digest": digest(task.spec), "at": time.time()})
+        with self.lock:
+            self.done[task.name] = digest(task.spec)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def clear(self):
+        with self.lock:
+            self.done = {}
+            if os.path.exists(self.path):
+                # Emptied rather than removed, so that a saved copy of the
+                # journal, such as the deploy workflow's cache, is replaced
+                # by an empty one instead of outliving the build
+                open(self.path, "w").close()
@@ -0,0 +1,212 @@
+import os
+import yaml
+
+DEFAULT_MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "togglestore.yaml")
+
+SECTIONS = (
+    "segments",
+    "metrics",
+    "metric_groups",
+    "flags",
+    "ai_configs",
+    "experiments",
+    "client_side_availability",
+    "toggles",
+    "targeting",
+    "release_pipeline",
+)
+
+# Fields every entry of a section must have
+REQUIRED_FIELDS = {
+    "segments": ("key", "name", "environment"),
+    "metrics": ("key", "name", "event_key"),
+    "metric_groups": ("key", "name", "metrics"),
+    "flags": ("key", "name", "variations"),
+    "ai_configs": ("key", "name"),
+    "experiments": ("key", "name", "environment", "flag", "metrics", "primary"),
+    "toggles": ("flag", "environment"),
+    "targeting": ("flag", "segment", "environment"),
+}
+
+ROLLOUT_TYPES = ("guarded", "progressive")
+PIPELINE_PHASES = ("test", "guard", "ga")
+
+
+class ManifestError(ValueError):
+    pass
+
+
+##################################################
+# Declarative project definition
+##################################################
+class Manifest:
+    """
+    The resources of a demo project, as loaded from a YAML manifest. Entries
+    reference each other by key, and load() fails on any reference that
+    does not resolve so a typo is reported before anything is created.
+    """
+
+    def __init__(self, data, path=None):
+        if not isinstance(data, dict):
+            raise ManifestError(f"{path or 'Manifest'}: expected a mapping of sections")
+        unknown = sorted(set(data) - set(SECTIONS))
+        if unknown:
+            raise ManifestError(f"{path or 'Manifest'}: unknown sections: {', '.join(unknown)}")
+        self.path = path
+        self.segments = data.get("segments") or []
+        self.metrics = data.get("metrics") or []
+        self.metric_groups = data.get("metric_groups") or []
+        self.flags = data.get("flags") or []
+        self.ai_configs = data.get("ai_configs") or []
+        self.experiments = data.get("experiments") or []
+        self.client_side_availability = data.get("client_side_availability") or []
+        self.toggles = data.get("toggles") or []
+        self.targeting = data.get("targeting") or []
+        self.release_pipeline = data.get("release_pipeline")
+        self.validate()
+
+    @classmethod
+    def load(cls, path=DEFAULT_MANIFEST):
+        with open(path) as f:
+            return cls(yaml.safe_load(f) or {}, path)
+
+    ##################################################
+    # Lookups
+    ##################################################
+    def segment_keys(self):
+        return {segment["key"] for segment in self.segments}
+
+    def metric_keys(self):
+        return {metric["key"] for metric in self.metrics}
+
+    def metric_group_keys(self):
+        return {group["key"] for group in self.metric_groups}
+
+    def flag_keys(self):
+        """Keys of every flag in the project, including the flags AI configs create."""
+        return {flag["key"] for flag in self.flags} | self.ai_config_keys()
+
+    def ai_config_keys(self):
+        return {config["key"] for config in self.ai_configs}
+
+    def is_metric_group(self, key):
+        return key in self.metric_group_keys()
+
+    def is_ai_config(self, key):
+        return key in self.ai_config_keys()
+
+    def pipeline_flag_keys(self):
+        if not self.release_pipeline:
+            return set()
+        return {entry["flag"] for entry in self.release_pipeline.get("flags", [])}
+
+    def environments(self):
+        """Every environment the manifest configures something in."""
+        envs = [segment["environment"] for segment in self.segments]
+        envs += [experiment["environment"] for experiment in self.experiments]
+        envs += [entry["environment"] for entry in self.toggles + self.targeting]
+        envs += [flag["rollout"]["environment"] for flag in self.flags if flag.get("rollout")]
+        return list(dict.fromkeys(envs))
+
+    def rollout_metrics(self, flag):
+        rollout = flag.get("rollout")
+        if not rollout:
+            return []
+        return rollout.get("metrics", flag.get("metrics", []))
+
+    ##################################################
+    # Validation
+    ##################################################
+    def validate(self):
+        errors = []
+
+        for section, fields in REQUIRED_FIELDS.items():
+            for index, entry in enumerate(getattr(self, section)):
+                if not isinstance(entry, dict):
+                    errors.append(f"{section}[{index}]: expected a mapping")
+                    continue
+                for field in fields:
+                    if field not in entry:
+                        errors.append(f"{section}[{index}]: missing {field}")
+        if errors:
+            raise ManifestError(self.describe(errors))
+
+        for section in ("segments", "metrics", "metric_groups", "flags", "ai_configs", "experiments"):
+            seen = set()
+            for entry in getattr(self, section):
+                if entry["key"] in seen:
+                    errors.append(f"{section}: duplicate key {entry['key']}")
+                seen.add(entry["key"])
+
+        metrics = self.metric_keys()
+        groups = self.metric_group_keys()
+        flags = self.flag_keys()
+        segments = self.segment_keys()
+        flag_variations = {flag["key"]: len(flag["variations"]) for flag in self.flags}
+
+        for group in self.metric_groups:
+            for key in group["metrics"]:
+                if key not in metrics:
+                    errors.append(f"metric group {group['key']}: unknown metric {key}")
+
+        for flag in self.flags:
+            for prereq in flag.get("prerequisites", []):
+                if prereq.get("flag") not in flag_variations:
+                    errors.append(f"flag {flag['key']}: unknown prerequisite flag {prereq.get('flag')}")
+                elif not 0 <= prereq.get("variation", 0) < flag_variations[prereq["flag"]]:
+                    errors.append(f"flag {flag['key']}: prerequisite {prereq['flag']} has no variation {prereq.get('variation')}")
+            for key in flag.get("metrics", []) + self.rollout_metrics(flag):
+                if key not in metrics:
+                    errors.append(f"flag {flag['key']}: unknown metric {key}")
+            rollout = flag.get("rollout")
+            if rollout is not None:
+                if rollout.get("type") not in ROLLOUT_TYPES:
+                    errors.append(f"flag {flag['key']}: rollout type must be one of {', '.join(ROLLOUT_TYPES)}")
+                if "environment" not in rollout:
+                    errors.append(f"flag {flag['key']}: rollout is missing environment")
+
+        for config in self.ai_configs:
+            for variation in config.get("variations", []):
+                for field in ("key", "name", "model_config_key", "model", "messages"):
+                    if field not in variation:
+                        errors.append(f"AI config {config['key']}: variation is missing {field}")
+
+        for experiment in self.experiments:
+            if experiment["flag"] not in flags:
+                errors.append(f"experiment {experiment['key']}: unknown flag {experiment['flag']}")
+            for key in experiment["metrics"]:
+                if key not in metrics and key not in groups:
+                    errors.append(f"experiment {experiment['key']}: unknown metric {key}")
+            if experiment["primary"] not in experiment["metrics"]:
+                errors.append(f"experiment {experiment['key']}: primary metric {experiment['primary']} is not one of its metrics")
+
+        for key in self.client_side_availability:
+            if key not in flags:
+                errors.append(f"client_side_availability: unknown flag {key}")
+
+        for toggle in self.toggles:
+            if toggle["flag"] not in flags:
+                errors.append(f"toggles: unknown flag {toggle['flag']}")
+
+        for target in self.targeting:
+            if target["flag"] not in flags:
+                errors.append(f"targeting: unknown flag {target['flag']}")
+            if target["segment"] not in segments:
+                errors.append(f"targeting: unknown segment {target['segment']}")
+
+        if self.release_pipeline is not None:
+            for field in ("key", "name"):
+                if field not in self.release_pipeline:
+                    errors.append(f"release_pipeline: missing {field}")
+            for entry in self.release_pipeline.get("flags", []):
+                if entry.get("flag") not in flag_variations:
+                    errors.append(f"release_pipeline: unknown flag {entry.get('flag')}")
+                for phase in entry.get("phases", []):
+                    if phase not in PIPELINE_PHASES:
+                        errors.append(f"release_pipeline: flag {entry.get('flag')} has unknown phase {phase}")
+
+        if errors:
+            raise ManifestError(self.describe(errors))
+
+    def describe(self, errors):
+        return f"{self.path or 'Manifest'} is invalid:\n  " + "\n  ".join(errors)
@@ -0,0 +1,271 @@
+import LDCatalog
+import LDJournal
+import LDManifest
+import LDPlatform
+import LDProjectBuilder
+import LDScheduler
+import LDTransport
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+DEFAULT_MAX_TENANTS = 4
+DEFAULT_PROGRESS_INTERVAL = 15.0
+
+
+##################################################
+# One demo environment in a multi-tenant build
+##################################################
+class Tenant:
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.project_key = namespace + "-togglestore"
+        self.project_name = f"ToggleStore - {namespace}"
+        self.email = namespace + "@launchdarkly.com"
+        # waiting -> running -> done | failed
+        self.status = "waiting"
+        self.builder = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def duration(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def progress(self):
+        """One line of how far the tenant's build has got."""
+        graph = self.builder.graph if self.builder is not None else None
+        if graph is None:
+            return f"{self.namespace}: {self.status}"
+        counts = graph.progress()
+        line = f"{self.namespace}: {counts.get('done', 0)}/{len(graph.tasks)} steps"
+        for status in ("running", "failed", "skipped"):
+            if counts.get(status):
+                line += f", {counts[status]} {status}"
+        return line + f" ({self.duration:.0f}s)"
+
+
+##################################################
+# Build the projects of many namespaces at once
+##################################################
+class MultiTenantBuilder:
+    """
+    Provisions the ToggleStore project of every namespace from one process.
+    The builders share one pooled session, one rate limiter and one member
+    directory, so connections stay warm across tenants and the route
+    budgets of the shared API key are respected as a whole. max_tenants
+    projects are built at a time, each on at most tenant_workers threads.
+    generate_results=False leaves out the experiment and guarded rollout results.
+    """
+
+    def __init__(
+        self,
+        api_key,
+        api_key_user,
+        namespaces,
+        max_tenants=DEFAULT_MAX_TENANTS,
+        tenant_workers=LDScheduler.DEFAULT_MAX_WORKERS,
+        manifest=None,
+        journal_dir=LDJournal.DEFAULT_DIRECTORY,
+        progress_interval=DEFAULT_PROGRESS_INTERVAL,
+        generate_results=True,
+    ):
+        self.api_key = api_key
+        self.api_key_user = api_key_user
+        self.tenants = [Tenant(namespace) for namespace in dict.fromkeys(namespaces)]
+        self.max_tenants = max(1, min(max_tenants, len(self.tenants)))
+        self.tenant_workers = tenant_workers
+        self.manifest = manifest if manifest is not None else LDManifest.Manifest.load()
+        self.journal_dir = journal_dir
+        self.progress_interval = progress_interval
+        self.generate_results = generate_results
+        # Enough connections for every worker of every tenant built at once
+        self.pool_size = self.max_tenants * tenant_workers
+        self.session = LDPlatform.LDPlatform.create_session(self.pool_size)
+        self.rate_limiter = LDTransport.RateLimiter()
+        self.member_directory = LDCatalog.MemberDirectory()
+
+    def create_builder(self, tenant):
+        builder = LDProjectBuilder.ToggleStoreBuilder(
+            self.api_key,
+            tenant.email,
+            self.api_key_user,
+            tenant.project_key,
+            tenant.project_name,
+            pool_size=self.pool_size,
+            manifest=self.manifest,
+            journal_dir=self.journal_dir,
+            max_workers=self.tenant_workers,
+            session=self.session,
+            rate_limiter=self.rate_limiter,
+            member_directory=self.member_directory,
+        )
+        # Keys go to the tenants file rather than GITHUB_ENV, where every
+        # tenant would overwrite the one before it
+        builder.export_env = False
+        # Per-step output is replaced by the periodic progress report
+        builder.verbose = False
+        builder.label = tenant.namespace
+        builder.results = self.generate_results
+        return builder
+
+    def run(self, mode="build", prune=True):
+        """Build or reconcile every tenant. Returns True if all of them completed."""
+        print(f"Provisioning {len(self.tenants)} projects, {self.max_tenants} at a time...")
+        started_at = time.time()
+        stop = threading.Event()
+        reporter = threading.Thread(target=self.report_progress, args=(stop,), daemon=True)
+        reporter.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_tenants, thread_name_prefix="ldtenant") as executor:
+                list(executor.map(lambda tenant: self.provision(tenant, mode, prune), self.tenants))
+        finally:
+            stop.set()
+            reporter.join()
+            self.session.close()
+        self.print_summary(time.time() - started_at)
+        return all(tenant.status == "done" for tenant in self.tenants)
+
+    def provision(self, tenant, mode, prune):
+        tenant.status = "running"
+        tenant.started_at = time.time()
+        try:
+            tenant.builder = self.create_builder(tenant)
+            if mode == "reconcile":
+                completed = tenant.builder.reconcile(prune=prune)
+            else:
+                completed = tenant.builder.build()
+            tenant.status = "done" if completed else "failed"
+        except Exception as e:
+            # One tenant failing leaves the others building
+            tenant.error = e
+            tenant.status = "failed"
+            print(f"[{tenant.namespace}] Error: {e}")
+        finally:
+            tenant.finished_at = time.time()
+        print(f"[{tenant.namespace}] {tenant.status} in {tenant.duration:.1f}s")
+
+    ##################################################
+    # Reporting
+    ##################################################
+    def report_progress(self, stop):
+        while not stop.wait(self.progress_interval):
+            running = [tenant for tenant in self.tenants if tenant.status == "running"]
+            finished = sum(1 for tenant in self.tenants if tenant.status in ("done", "failed"))
+            print(f"Progress: {finished}/{len(self.tenants)} projects finished")
+            for tenant in running:
+                print("  " + tenant.progress())
+
+    def print_summary(self, seconds):
+        done = [tenant for tenant in self.tenants if tenant.status == "done"]
+        print(f"Provisioned {len(done)} of {len(self.tenants)} projects in {seconds:.1f}s "
+              f"({sum(tenant.duration for tenant in self.tenants):.1f}s one after another)")
+        for tenant in self.tenants:
+            print(f"  {tenant.namespace:24s} {tenant.status:7s} {tenant.duration:6.1f}s  {tenant.project_key}")
+        print(f"Rate limit waits: {self.rate_limiter.sleep_time:.1f}s, "
+              f"member lookups: {len(self.member_directory)} ({self.member_directory.hits} shared)")
+
+    def results(self):
+        """{namespace: project key, SDK and client-side keys and status} of every tenant."""
+        return {
+            tenant.namespace: {
+                "project_key": tenant.project_key,
+                "sdk_key": tenant.builder.sdk_key if tenant.builder is not None else "",
+                "client_key": tenant.builder.client_id if tenant.builder is not None else "",
+                "status": tenant.status,
+                "seconds": round(tenant.duration, 1),
+            }
+            for tenant in self.tenants
+        }
+
+    def write_results(self, path):
+        try:
+            with open(path, "w") as f:
+                json.dump(self.results(), f, indent=2)
+        except IOError as e:
+            print(f"Unable to write tenants file: {e}")
+
+
+def read_namespaces(values, path=None):
+    """Namespaces from the command line, comma or whitespace separated, and one per line of path."""
+    namespaces = [name for value in values for name in value.replace(",", " ").split()]
+    if path:
+        with open(path) as f:
+            namespaces += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    return namespaces
+
+
+############################################################################################################
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Create the ToggleStore LaunchDarkly projects of many namespaces")
+    parser.add_argument("namespaces", nargs="*", help="Demo namespaces, defaults to DEMO_NAMESPACES")
+    parser.add_argument("--namespaces-file", default=os.getenv("DEMO_NAMESPACES_FILE"), help="File with one namespace per line")
+    parser.add_argument(
+        "--mode",
+        choices=["build", "reconcile"],
+        default=os.getenv("LD_BUILD_MODE", "build"),
+        help="build recreates the projects, reconcile updates them in place",
+    )
+    parser.add_argument("--manifest", default=os.getenv("LD_MANIFEST", LDManifest.DEFAULT_MANIFEST))
+    parser.add_argument(
+        "--max-tenants",
+        type=int,
+        default=int(os.getenv("LD_MAX_TENANTS", DEFAULT_MAX_TENANTS)),
+        help="Projects built at the same time",
+    )
+    parser.add_argument(
+        "--tenant-workers",
+        type=int,
+        default=int(os.getenv("LD_TENANT_WORKERS", LDScheduler.DEFAULT_MAX_WORKERS)),
+        help="Concurrent build steps per project",
+    )
+    parser.add_argument(
+        "--output",
+        default=os.getenv("LD_TENANTS_FILE", "ld-tenants.json"),
+        help="JSON file the project keys, SDK keys and client-side IDs are written to",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=float(os.getenv("LD_PROGRESS_INTERVAL", DEFAULT_PROGRESS_INTERVAL)),
+        help="Seconds between progress reports",
+    )
+    parser.add_argument(
+        "--no-results",
+        dest="generate_results",
+        action="store_false",
+        default=os.getenv("LD_RESULTS", "true").lower() != "false",
+        help="Skip generating experiment and guarded rollout results",
+    )
+    args = parser.parse_args()
+
+    LD_API_KEY = os.getenv("LD_API_KEY")
+    LD_API_KEY_USER = os.getenv("LD_API_KEY_USER")
+    LD_PRUNE = os.getenv("LD_PRUNE", "true").lower() != "false"
+    LD_JOURNAL_DIR = os.getenv("LD_JOURNAL_DIR", LDJournal.DEFAULT_DIRECTORY)
+
+    namespaces = read_namespaces(args.namespaces or [os.getenv("DEMO_NAMESPACES", "")], args.namespaces_file)
+    if not namespaces:
+        parser.error("no namespaces given")
+
+    builder = MultiTenantBuilder(
+        LD_API_KEY, LD_API_KEY_USER, namespaces,
+        max_tenants=args.max_tenants, tenant_workers=args.tenant_workers,
+        manifest=LDManifest.Manifest.load(args.manifest), journal_dir=LD_JOURNAL_DIR,
+        progress_interval=args.progress_interval, generate_results=args.generate_results)
+    completed = builder.run(args.mode, prune=LD_PRUNE)
+    builder.write_results(args.output)
+    if not completed:
+        raise SystemExit(1)
@@ -0,0 +1,359 @@
+import bisect
+import contextlib
+import io
+import itertools
+import json
+import threading
+from urllib.parse import urlparse
+
+import yaml
+
+import LDScheduler
+import LDTransport
+
+# Seconds per request and requests per window, per route. The budgets are a
+# guess at the API's route limits: tune them from the X-Ratelimit headers of
+# a real build
+DEFAULT_MODEL = {
+    "latency": {
+        "default": 0.25,
+        "methods": {"GET": 0.15, "POST": 0.35, "PATCH": 0.3, "PUT": 0.3, "DELETE": 0.25},
+        "routes": {"POST /api/v2/projects": 1.5},
+    },
+    "budgets": {
+        "default": {"limit": 25, "window": 10.0},
+        "routes": {},
+    },
+}
+
+SEMANTIC_PATCH = "domain-model=launchdarkly.semanticpatch"
+
+
+def load_model(path=None):
+    """DEFAULT_MODEL, with anything set in the YAML file at path on top."""
+    model = json.loads(json.dumps(DEFAULT_MODEL))
+    if path:
+        with open(path) as f:
+            overrides = yaml.safe_load(f) or {}
+        for section in ("latency", "budgets"):
+            for key, value in (overrides.get(section) or {}).items():
+                if isinstance(value, dict) and isinstance(model[section].get(key), dict) and key != "default":
+                    model[section][key].update(value)
+                else:
+                    model[section][key] = value
+    return model
+
+
+##################################################
+# Offline stand-in for the LaunchDarkly API
+##################################################
+class PlannedResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.headers = {}
+        self.text = json.dumps(data) if data is not None else ""
+        self.content = self.text.encode()
+        self.ok = status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class PlannedCall:
+    __slots__ = ("method", "url", "route", "node", "phase", "status", "body", "semantic", "thread")
+
+    def __init__(self, method, url, route, node, phase, status, body, semantic, thread):
+        self.method = method
+        self.url = url
+        self.route = route
+        self.node = node
+        self.phase = phase
+        self.status = status
+        self.body = body
+        self.semantic = semantic
+        self.thread = thread
+
+
+class PlannedAPI:
+    """
+    Session replacement that answers every request from memory and records
+    it. Creates are stored so later reads of them succeed; just enough of
+    the API is imitated for a build to run through: created projects get
+    environments, flags and AI config variations get IDs, AI configs get
+    their flag and release pipelines their phase IDs.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.store = {}
+        self.calls = []
+        self.ids = itertools.count(1)
+
+    def close(self):
+        pass
+
+    def request(self, method, url, json=None, headers=None):
+        method = method.upper()
+        with self.lock:
+            status, data = self.respond(method, url, json)
+            task = LDScheduler.current_task()
+            self.calls.append(PlannedCall(
+                method,
+                url,
+                LDTransport.route_key(method, url),
+                task.name if task is not None else "(setup)",
+                task.phase if task is not None else "(setup)",
+                status,
+                json,
+                SEMANTIC_PATCH in (headers or {}).get("Content-Type", ""),
+                threading.current_thread().name,
+            ))
+        return PlannedResponse(status, data)
+
+    def new_id(self):
+        return "planned-%d" % next(self.ids)
+
+    def respond(self, method, url, body):
+        path = urlparse(url).path.rstrip("/")
+        if method == "GET":
+            if path.endswith("/members"):
+                return 200, {"totalCount": 1, "items": [{"_id": "planned-member"}]}
+            if path in self.store:
+                return 200, self.store[path]
+            if "/environments/" in path and path.rsplit("/environments/", 1)[0] in self.store:
+                project = self.store[path.rsplit("/environments/", 1)[0]]
+                for env in project.get("environments", []):
+                    if env["key"] == path.rsplit("/", 1)[1]:
+                        return 200, env
+            children = [doc for key, doc in self.store.items() if key.rsplit("/", 1)[0] == path]
+            # Lists are paged, single resources are not
+            if children or "limit=" in urlparse(url).query:
+                return 200, {"items": children, "totalCount": len(children)}
+            return 404, {"message": "Unknown resource"}
+        if method == "POST":
+            if not isinstance(body, dict) or "key" not in body:
+                return 201, {"_id": self.new_id()}
+            key = path + "/" + body["key"]
+            if key in self.store:
+                return 409, {"message": "Resource already exists", "code": "conflict"}
+            doc = dict(body, _id=self.new_id())
+            if "variations" in doc:
+                doc["variations"] = [dict(var, _id=self.new_id()) for var in doc["variations"]]
+            if path.endswith("/projects"):
+                doc["environments"] = [
+                    {"key": env, "_id": self.new_id(), "apiKey": "sdk-planned-" + env}
+                    for env in ("production", "test")
+                ]
+            if path.endswith("/release-pipelines"):
+                doc["phases"] = [dict(phase, id=self.new_id()) for phase in doc.get("phases", [])]
+            if path.endswith("/ai-configs"):
+                project_key = path.split("/")[4]
+                self.store["/api/v2/flags/" + project_key + "/" + body["key"]] = {
+                    "key": body["key"],
+                    "variations": [{"_id": self.new_id(), "name": "disabled", "value": {"_ldMeta": {"enabled": False}}}],
+                }
+            if path.endswith("/variations") and "/ai-configs/" in path:
+                parts = path.split("/")
+                flag = self.store.get("/api/v2/flags/" + parts[4] + "/" + parts[6])
+                if flag is not None:
+                    flag["variations"].append({"_id": self.new_id(), "name": body.get("name"), "value": {"_ldMeta": {"enabled": True}}})
+            self.store[key] = doc
+            return 201, doc
+        if method == "DELETE":
+            for key in [key for key in self.store if key == path or key.startswith(path + "/")]:
+                del self.store[key]
+            return 204, None
+        if method == "PUT" and path.endswith("/release"):
+            # Enrolling a flag creates its release, which the pipeline
+            # advancer reads back
+            self.store[path] = dict(body or {}, phases=[])
+            return 201, self.store[path]
+        if method == "PUT" and "/release/phases/" in path:
+            release_path, phase_id = path.split("/phases/", 1)
+            release = self.store.get(release_path)
+            if release is None:
+                return 404, {"message": "Unknown resource"}
+            release["phases"] = [phase for phase in release["phases"] if phase["_id"] != phase_id]
+            release["phases"].append({"_id": phase_id, "status": (body or {}).get("status")})
+            return 200, release
+        return 200, self.store.get(path, {})
+
+
+##################################################
+# Route rate limit budgets over simulated time
+##################################################
+class SimulatedLimiter:
+    def __init__(self, model):
+        self.model = model
+        self.sent = {}
+
+    def budget(self, route):
+        budget = self.model["budgets"]["routes"].get(route, self.model["budgets"]["default"])
+        return budget["limit"], budget["window"]
+
+    def slot(self, route, at):
+        """Earliest time at or after at when a request on route fits its budget."""
+        limit, window = self.budget(route)
+        sent = self.sent.setdefault(route, [])
+        while True:
+            first = bisect.bisect_right(sent, at - window)
+            last = bisect.bisect_right(sent, at)
+            if last - first < limit:
+                bisect.insort(sent, at)
+                return at
+            # Just after the oldest request in the window leaves it
+            at = sent[last - limit] + window + 1e-6
+
+
+##################################################
+# Dry run of a build
+##################################################
+class BuildPlanner:
+    """
+    Runs the builder's graph against PlannedAPI, then replays the recorded
+    calls over a latency model and per-route rate limit budgets to estimate
+    how long the real build takes, e.g. after adding flags to the manifest.
+    """
+
+    def __init__(self, builder, model=None):
+        self.builder = builder
+        self.api = builder.ldproject.session
+        self.model = model if model is not None else load_model()
+
+    def latency(self, call):
+        latency = self.model["latency"]
+        if call.route in latency["routes"]:
+            return latency["routes"][call.route]
+        return latency["methods"].get(call.method, latency["default"])
+
+    def run(self):
+        graph = self.builder.build_graph()
+        graph.verbose = False
+        # The builder's own progress output is not part of the plan
+        with contextlib.redirect_stdout(io.StringIO()):
+            completed = graph.run()
+        report = self.estimate(graph)
+        report["completed"] = completed
+        self.print_report(report)
+        return report
+
+    ##################################################
+    # Estimate
+    ##################################################
+    def estimate(self, graph):
+        calls = {}
+        for call in self.api.calls:
+            calls.setdefault(call.node, []).append(call)
+
+        limiter = SimulatedLimiter(self.model)
+        finish = {}
+        # Setup calls (the member lookup) come before any step
+        clock = 0.0
+        for call in calls.get("(setup)", []):
+            clock = limiter.slot(call.route, clock) + self.latency(call)
+
+        # List scheduling on max_workers, starting each step as soon as its
+        # dependencies are done and a worker is free
+        workers = [clock] * graph.max_workers
+        for name in graph.order():
+            task = graph.tasks[name]
+            ready = max([finish[dep] for dep in task.deps] + [clock])
+            worker = min(range(len(workers)), key=lambda i: max(workers[i], ready))
+            start = max(workers[worker], ready)
+            # Calls a step sends from its own worker pool overlap, one lane
+            # per thread
+            lanes = {}
+            for call in calls.get(name, []):
+                lanes.setdefault(call.thread, []).append(call)
+            at = start
+            for lane in lanes.values():
+                lane_at = start
+                for call in lane:
+                    lane_at = limiter.slot(call.route, lane_at) + self.latency(call)
+                at = max(at, lane_at)
+            finish[name] = at
+            workers[worker] = at
+            task.started_at = start
+            task.finished_at = at
+        graph.started_at = 0.0
+        graph.finished_at = max(finish.values(), default=clock)
+
+        path, path_time = graph.critical_path()
+        routes = {}
+        for call in self.api.calls:
+            routes[call.route] = routes.get(call.route, 0) + 1
+        return {
+            "calls": len(self.api.calls),
+            "routes": dict(sorted(routes.items(), key=lambda item: -item[1])),
+            "estimated_seconds": graph.finished_at,
+            "serial_seconds": sum(self.latency(call) for call in self.api.calls),
+            "critical_path": path,
+            "critical_path_seconds": path_time,
+            "phases": graph.phase_times(),
+            "batchable": self.batchable(),
+            "skippable": self.skippable(),
+        }
+
+    def batchable(self):
+        """Flags and environments that get more than one semantic patch."""
+        patches = {}
+        for call in self.api.calls:
+            if call.method == "PATCH" and call.semantic:
+                env_key = (call.body or {}).get("environmentKey")
+                flag_key = urlparse(call.url).path.rstrip("/").rsplit("/", 1)[1]
+                patches.setdefault((flag_key, env_key), []).append(call.node)
+        return {
+            f"{flag_key} ({env_key or 'all environments'})": nodes
+            for (flag_key, env_key), nodes in patches.items()
+            if len(nodes) > 1
+        }
+
+    def skippable(self):
+        """GETs the build could do without, by reason."""
+        reasons = {"existence probe": [], "repeated read": [], "read of a resource this build created": []}
+        created = set()
+        read = set()
+        for call in self.api.calls:
+            path = urlparse(call.url).path.rstrip("/")
+            if call.method == "POST" and isinstance(call.body, dict) and "key" in call.body:
+                created.add(path + "/" + call.body["key"])
+            if call.method != "GET":
+                continue
+            # Releases are polled while their phases change, and every read
+            # is needed
+            if path.endswith("/release"):
+                continue
+            if call.status == 404:
+                reasons["existence probe"].append(call.url)
+            elif call.url in read:
+                reasons["repeated read"].append(call.url)
+            elif path in created:
+                reasons["read of a resource this build created"].append(call.url)
+            read.add(call.url)
+        return reasons
+
+    ##################################################
+    # Report
+    ##################################################
+    def print_report(self, report):
+        print(f"Plan for project {self.builder.project_key}: {report['calls']} API calls")
+        if not report["completed"]:
+            print("Warning: some steps failed against the offline API, the plan is incomplete")
+        print("\nCalls by route:")
+        for route, count in report["routes"].items():
+            print(f"  {count:5d}  {route}")
+        print(f"\nEstimated build time: {report['estimated_seconds']:.1f}s "
+              f"({report['serial_seconds']:.1f}s if every call were sent one after another)")
+        print(f"Critical path ({report['critical_path_seconds']:.1f}s): {' -> '.join(report['critical_path'])}")
+        print("\nPhases:")
+        for phase, (start, end) in sorted(report["phases"].items(), key=lambda item: item[1]):
+            print(f"  {phase:24s} {start:6.1f}s - {end:6.1f}s")
+        if report["batchable"]:
+            print("\nSemantic patches that could be batched:")
+            for target, nodes in report["batchable"].items():
+                print(f"  {len(nodes)} patches to {target} from {', '.join(sorted(set(nodes)))}")
+        skippable = {reason: urls for reason, urls in report["skippable"].items() if urls}
+        if skippable:
+            print("\nCalls that could be skipped:")
+            for reason, urls in skippable.items():
+                print(f"  {len(urls)} x {reason}, e.g. {urls[0]}")
@@ -1,7 +1,35 @@
+import contextlib
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 import json
+import threading
 import time
 import uuid
+from urllib.parse import urlparse
+
+import LDCatalog
+import LDInventory
+import LDScheduler
+import LDTransport
+
+DEFAULT_POOL_SIZE = 10
+
+# Create routes whose resources carry a maintainer, by resource type
+MAINTAINED_ROUTES = {
+    "POST /api/v2/flags/*": "flags",
+    "POST /api/v2/metrics/*": "metrics",
+    "POST /api/v2/projects/*/ai-configs": "ai-configs",
+}
+
+# Fields patched back into line when an optimistic create finds the resource
+# already exists
+RECONCILE_FIELDS = {
+    "flags": ["name", "description", "temporary", "tags"],
+    "metrics": ["name", "description", "tags"],
+    "segments": ["name", "description"],
+    "metric-groups": ["name", "description", "tags"],
+}
 
 
 class LDPlatform:
@@ -14,54 +42,474 @@ class LDPlatform:
     client_id = ""
     sdk_key = ""
     user_id = None
+    session = None
+    rate_limiter = None
+    retry_policy = None
+    response_cache = None
+    single_flight = None
+    inventory = None
+    flag_catalog = None
+    ai_config_catalog = None
+    pipeline_phases = None
+    member_directory = None
+    report = None
+    optimistic_create = False
+    reconcile_conflicts = False
+    patch_lock = None
+    patch_batches = None
+    maintained = None
 
     ##################################################
     # Constructor
     ##################################################
-    def __init__(self, api_key, api_key_user, email):
+    def __init__(
+        self,
+        api_key,
+        api_key_user,
+        email,
+        pool_size=DEFAULT_POOL_SIZE,
+        session=None,
+        rate_limiter=None,
+        retry_policy=None,
+        response_cache=None,
+        member_directory=None,
+        report=None,
+    ):
         self.api_key = api_key
         self.api_key_user = api_key_user
+        self.session = session if session is not None else self.create_session(pool_size)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else LDTransport.RateLimiter()
+        self.retry_policy = retry_policy if retry_policy is not None else self.create_retry_policy()
+        self.response_cache = response_cache if response_cache is not None else LDTransport.ResponseCache()
+        self.single_flight = LDTransport.SingleFlight()
+        self.flag_catalog = LDCatalog.FlagCatalog()
+        self.ai_config_catalog = LDCatalog.AIConfigCatalog()
+        # Member IDs can be shared with other platforms on the same account
+        self.member_directory = member_directory if member_directory is not None else LDCatalog.MemberDirectory()
+        self.patch_lock = threading.Lock()
+        # Batches are per thread, so concurrent builder steps only ever
+        # flush their own queued instructions
+        self.patch_batches = threading.local()
+        # (resource type, key) of resources known to be maintained by user_id
+        self.maintained = set()
+        # Release pipeline key -> {phase name: phase ID}
+        self.pipeline_phases = {}
+        # Accounting of every request sent, see LDReport.BuildReport
+        self.report = report
         self.user_id = self.get_user_id(email)
 
-    def getrequest(self, method, url, json=None, headers=None):
+    ##################################################
+    # Create a pooled keep-alive HTTP session
+    ##################################################
+    @staticmethod
+    def create_session(pool_size=DEFAULT_POOL_SIZE):
+        """
+        Build a requests Session whose connections to app.launchdarkly.com are
+        kept alive and reused across calls, so a build pays for TCP+TLS setup
+        once per pooled connection instead of once per request.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
 
-        response = requests.request(method, url, json=json, headers=headers)
+    def close(self):
+        if self.session is not None:
+            self.session.close()
 
-        #########################
-        # Rate limiting Logic
-        #########################
+    def getrequest(self, method, url, json=None, headers=None, idempotent=None, cache=True):
+        """
+        Send a request through the pooled session, rate limiter and retry
+        policy. Pass idempotent=True for a PATCH/POST that is safe to replay
+        after a server error: keyed creates answer a replay with 409, and
+        repeating a toggle or a maintainer replace changes nothing.
+
+        Successful GETs are served from and stored in the response cache
+        unless cache=False, and expired entries are revalidated with
+        If-None-Match. Concurrent identical GETs are coalesced into one
+        request. Any other verb invalidates the resource it writes, and
+        flags and AI config variations returned by writes are added to the
+        catalogs.
+        """
+        if method.upper() != "GET":
+            response = self.send_request(method, url, json=json, headers=headers, idempotent=idempotent)
+            for related_url in self.related_resource_urls(url):
+                self.response_cache.invalidate(related_url)
+            self.seed_catalogs(method, url, response, json)
+            return response
 
-        if "X-Ratelimit-Route-Remaining" in response.headers:
-            # Completely stolen from Tom Totenberg :)
-            call_limit = 5
-            delay = 5
-            tries = 5
-            limit_remaining = response.headers["X-Ratelimit-Route-Remaining"]
+        # Identical GETs already in flight on another thread share its response
+        flight_key = LDTransport.ResponseCache.key(url, headers) + (
+            (headers or {}).get("Authorization"),
+            cache,
+        )
+        return self.single_flight.do(
+            flight_key,
+            lambda: self.fetch(url, headers=headers, idempotent=idempotent, cache=cache),
+        )
 
-            if int(limit_remaining) <= call_limit:
-                resetTime = int(response.headers["X-Ratelimit-Reset"])
-                currentMilliTime = round(time.time() * 1000)
-                if resetTime - currentMilliTime > 0:
-                    delay = round((resetTime - currentMilliTime) // 1000)
-                else:
-                    delay = 0
+    def fetch(self, url, headers=None, idempotent=None, cache=True):
+        if not cache:
+            return self.send_request("GET", url, headers=headers, idempotent=idempotent)
+
+        cached = self.response_cache.get(url, headers)
+        if cached is not None:
+            return cached
+
+        # Revalidate an expired entry with If-None-Match where we have an ETag
+        request_headers = headers
+        etag = self.response_cache.etag(url, headers)
+        if etag is not None:
+            request_headers = dict(headers or {})
+            request_headers["If-None-Match"] = etag
+
+        generation = self.response_cache.generation
+        response = self.send_request("GET", url, headers=request_headers, idempotent=idempotent)
+        if response.status_code == 304 and etag is not None:
+            revalidated = self.response_cache.revalidate(url, headers)
+            if revalidated is not None:
+                return revalidated
+            # The entry was evicted or invalidated since its ETag was read,
+            # so a 304 has no body to answer with: fetch the resource again
+            generation = self.response_cache.generation
+            response = self.send_request("GET", url, headers=headers, idempotent=idempotent)
+
+        self.response_cache.record_miss()
+        if response.status_code == 200:
+            self.response_cache.put(url, response, headers, generation)
+        return response
 
-                if delay < 1:
-                    delay = 0.5
+    def send_request(self, method, url, json=None, headers=None, idempotent=None):
+        route = LDTransport.route_key(method, url)
+        policy = self.retry_policy.for_route(route)
+        attempt = 0
+        # Seconds spent waiting on rate limits (the limiter and 429s) and
+        # backing off from other failures, for the build report
+        waited = 0.0
+        backed_off = 0.0
+        # Whether an earlier attempt may have reached the server, so a keyed
+        # create's 409 can be its own first attempt having succeeded
+        replayed = False
+
+        while True:
+            #########################
+            # Rate limiting Logic
+            #########################
+            # Wait for the route's budget before sending, then learn the
+            # remaining budget from the response headers
+            waited += self.rate_limiter.acquire(route)
 
-                tries -= 1
+            try:
+                response = self.session.request(method, url, json=json, headers=headers)
+            except (requests.ConnectionError, requests.Timeout):
+                if not policy.should_retry_error(method, attempt, idempotent):
+                    self.record_request(route, None, json, None, waited, backed_off, attempt)
+                    raise
+                delay = policy.backoff(attempt)
+                backed_off += delay
                 time.sleep(delay)
-                if tries == 0:
-                    return "Rate limit exceeded. Please try again later."
+                attempt += 1
+                replayed = True
+                continue
+
+            self.rate_limiter.update(route, response.headers)
+
+            #########################
+            # Retry Logic
+            #########################
+            if not policy.should_retry(method, response.status_code, attempt, idempotent):
+                self.record_request(route, response.status_code, json, response, waited, backed_off, attempt)
+                response.replayed = replayed
+                return response
+            delay = policy.delay(attempt, response)
+            if response.status_code == 429:
+                waited += delay
             else:
-                tries = 5
+                backed_off += delay
+                replayed = True
+            time.sleep(delay)
+            attempt += 1
+
+    def record_request(self, route, status_code, body, response, waited, backed_off, retries):
+        if self.report is not None:
+            self.report.record(LDScheduler.current_phase(), route, status_code, body, response, waited, backed_off, retries)
+
+    ##################################################
+    # Answer *_exists checks from a project inventory
+    ##################################################
+    def use_inventory(self, enabled=True):
+        """
+        Answer flag/metric/segment/metric group/experiment/release pipeline
+        existence checks from one list fetch per resource type instead of a
+        GET probe per resource.
+        """
+        self.inventory = LDInventory.ProjectInventory(self) if enabled else None
+
+    ##################################################
+    # Create without probing for an existing resource
+    ##################################################
+    def use_optimistic_create(self, enabled=True, reconcile=False):
+        """
+        POST flags, metrics, segments, metric groups, experiments and release
+        pipelines without checking for them first. A 409 Conflict is taken to
+        mean the resource already exists; with reconcile=True it is then
+        updated to match what the create would have set.
+        """
+        self.optimistic_create = enabled
+        self.reconcile_conflicts = reconcile
+
+    @staticmethod
+    def replayed(response):
+        """
+        True if the request was retried after a server error or a dropped
+        connection. A 409 to such a keyed create means the attempt whose
+        response was lost created the resource.
+        """
+        return getattr(response, "replayed", False)
 
+    def resolve_create_conflict(self, resource_type, key, payload, resource_url, env_key=None):
+        if self.inventory is not None:
+            self.inventory.add(resource_type, key, None, env_key)
+        if not self.reconcile_conflicts:
+            return None
+        return self.update_resource(resource_type, key, payload, env_key, resource_url=resource_url)
+
+    @staticmethod
+    def reconcile_request(resource_type, payload):
+        """Return (method, body, content type) bringing an existing resource in line with payload."""
+        if resource_type == "experiments":
+            # Experiments only take semantic patches, and only the name is
+            # editable outside of a new iteration
+            return (
+                "PATCH",
+                {"instructions": [{"kind": "updateName", "value": payload["name"]}]},
+                "application/json; domain-model=launchdarkly.semanticpatch",
+            )
+        if resource_type == "release-pipelines":
+            return ("PUT", payload, "application/json")
+        patch = [
+            {"op": "replace", "path": "/" + field, "value": payload[field]}
+            for field in RECONCILE_FIELDS.get(resource_type, [])
+            if field in payload
+        ]
+        return ("PATCH", patch or None, "application/json")
+
+    ##################################################
+    # Update or delete an existing resource
+    ##################################################
+    def update_resource(self, resource_type, key, payload, env_key=None, resource_url=None):
+        """Bring the fields of payload that can be reconciled in line on an existing resource."""
+        method, body, content_type = self.reconcile_request(resource_type, payload)
+        if body is None:
+            return None
+        if resource_url is None:
+            resource_url = LDInventory.resource_url(resource_type, self.project_key, key, env_key)
+        headers = {
+            "Content-Type": content_type,
+            "Authorization": self.api_key,
+        }
+        if LDInventory.RESOURCE_TYPES[resource_type]["beta"]:
+            headers["LD-API-Version"] = "beta"
+        response = self.getrequest(method, resource_url, json=body, headers=headers, idempotent=True)
+        if response.status_code >= 400:
+            print(f"Error reconciling {resource_type} {key}: HTTP {response.status_code}")
+        return response
+
+    def patch_resource(self, resource_type, key, patch, env_key=None):
+        """Apply a JSON patch to an existing resource."""
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": self.api_key,
+        }
+        if LDInventory.RESOURCE_TYPES[resource_type]["beta"]:
+            headers["LD-API-Version"] = "beta"
+        response = self.getrequest(
+            "PATCH",
+            LDInventory.resource_url(resource_type, self.project_key, key, env_key),
+            json=patch,
+            headers=headers,
+        )
+        if response.status_code >= 400:
+            print(f"Error reconciling {resource_type} {key}: HTTP {response.status_code}")
+        return response
+
+    def delete_resource(self, resource_type, key, env_key=None):
+        headers = {"Authorization": self.api_key}
+        if LDInventory.RESOURCE_TYPES[resource_type]["beta"]:
+            headers["LD-API-Version"] = "beta"
+        response = self.getrequest(
+            "DELETE",
+            LDInventory.resource_url(resource_type, self.project_key, key, env_key),
+            headers=headers,
+        )
+        if response.status_code >= 400 and response.status_code != 404:
+            print(f"Error deleting {resource_type} {key}: HTTP {response.status_code}")
+            return response
+        if self.inventory is not None:
+            self.inventory.remove(resource_type, key, env_key)
+        if resource_type == "flags":
+            self.flag_catalog.remove(key)
+        elif resource_type == "release-pipelines":
+            self.pipeline_phases.pop(key, None)
         return response
 
+    ##################################################
+    # Batch flag semantic patches
+    ##################################################
+    @contextlib.contextmanager
+    def batch_flag_patches(self):
+        """
+        While open, toggle_flag, add_segment_to_flag, add_prerequisite_to_flag,
+        update_flag_client_side_availability and the rollout helpers queue
+        their instructions instead of sending them. On exit the queue is
+        sent as one PATCH per flag and environment, e.g.
+
+            with ld.batch_flag_patches():
+                ld.toggle_flag("rewardsProgram", "on", "production")
+                ld.add_segment_to_flag("rewardsProgram", "developers", "production")
+
+        Batching applies to calls made on the current thread.
+        """
+        batch = self.patch_batches
+        if getattr(batch, "depth", 0) == 0:
+            batch.depth = 0
+            batch.pending = {}
+        batch.depth += 1
+        try:
+            yield self
+        finally:
+            batch.depth -= 1
+            if batch.depth == 0:
+                self.flush_flag_patches()
+
+    def patch_flag(self, flag_key, env_key, instructions, comment=None, ignore_conflicts=False, idempotent=None):
+        """
+        Send a semantic patch to a flag, or queue it when batching. env_key
+        is None for flag-level instructions. Returns the response, or None
+        if the instructions were queued.
+        """
+        batch = self.patch_batches
+        if getattr(batch, "depth", 0) > 0:
+            pending = batch.pending.setdefault(
+                (flag_key, env_key),
+                {"instructions": [], "comments": [], "ignore_conflicts": False, "idempotent": True},
+            )
+            pending["instructions"].extend(instructions)
+            if comment and comment not in pending["comments"]:
+                pending["comments"].append(comment)
+            pending["ignore_conflicts"] = pending["ignore_conflicts"] or ignore_conflicts
+            pending["idempotent"] = pending["idempotent"] and bool(idempotent)
+            return None
+        return self.send_flag_patch(flag_key, env_key, instructions, comment, ignore_conflicts, idempotent)
+
+    def send_flag_patch(self, flag_key, env_key, instructions, comment=None, ignore_conflicts=False, idempotent=None):
+        url = (
+            "https://app.launchdarkly.com/api/v2/flags/"
+            + self.project_key
+            + "/"
+            + flag_key
+        )
+        if ignore_conflicts:
+            url += "?ignoreConflicts=true"
+        headers = {
+            "Authorization": self.api_key,
+            "Content-Type": "application/json; domain-model=launchdarkly.semanticpatch",
+        }
+        payload = {"instructions": instructions}
+        if env_key is not None:
+            payload["environmentKey"] = env_key
+        if comment is not None:
+            payload["comment"] = comment
+
+        res = self.getrequest("PATCH", url, headers=headers, json=payload, idempotent=idempotent)
+        if res.status_code != 200:
+            print(f"Error patching flag {flag_key}: HTTP {res.status_code}")
+        return res
+
+    def flush_flag_patches(self, flag_key=None):
+        """Send this thread's queued instructions, for one flag or all of them. Returns the responses."""
+        queued = getattr(self.patch_batches, "pending", {})
+        keys = [key for key in queued if flag_key is None or key[0] == flag_key]
+        batches = [(key, queued.pop(key)) for key in keys]
+
+        responses = []
+        for (key, env_key), pending in batches:
+            responses.append(
+                self.send_flag_patch(
+                    key,
+                    env_key,
+                    pending["instructions"],
+                    "; ".join(pending["comments"]) if pending["comments"] else None,
+                    pending["ignore_conflicts"],
+                    pending["idempotent"],
+                )
+            )
+        return responses
+
+    ##################################################
+    # Keep the catalogs current from write responses
+    ##################################################
+    def seed_catalogs(self, method, url, response, payload=None):
+        if response.status_code not in (200, 201):
+            return
+        route = LDTransport.route_key(method, url)
+        try:
+            if route in MAINTAINED_ROUTES:
+                data = response.json()
+                maintainer = data.get("maintainerId", (payload or {}).get("maintainerId"))
+                if maintainer is not None and maintainer == self.user_id and "key" in data:
+                    with self.patch_lock:
+                        self.maintained.add((MAINTAINED_ROUTES[route], data["key"]))
+            if route in ("POST /api/v2/flags/*", "PATCH /api/v2/flags/*/*"):
+                # Flag creates and patches return the whole flag
+                self.flag_catalog.seed(response.json())
+            elif route == "POST /api/v2/projects/*/ai-configs":
+                self.ai_config_catalog.seed_config(response.json())
+            elif route == "POST /api/v2/projects/*/ai-configs/*/variations":
+                config_key = urlparse(url).path.strip("/").split("/")[5]
+                self.ai_config_catalog.add_variation(config_key, response.json())
+        except ValueError:
+            pass
+
+    ##################################################
+    # Resources affected by a write
+    ##################################################
+    def related_resource_urls(self, url):
+        # Flag sub-resources under /projects/{project}/flags/{flag} (release,
+        # measured rollout configuration) also change the flag document
+        # served from /flags/{project}/{flag}
+        urls = [url]
+        parts = urlparse(url).path.strip("/").split("/")
+        if len(parts) >= 6 and parts[2] == "projects" and parts[4] == "flags":
+            urls.append(
+                "https://app.launchdarkly.com/api/v2/flags/" + parts[3] + "/" + parts[5]
+            )
+        return urls
+
+    ##################################################
+    # Default retry policy
+    ##################################################
+    @staticmethod
+    def create_retry_policy():
+        # Advancing a release phase is rejected until the flag's previous
+        # phase has settled, so those PUTs also retry on 400/409 with short
+        # backoff instead of a fixed sleep
+        return LDTransport.RetryPolicy(
+            routes={
+                "PUT /api/v2/projects/*/flags/*/release/phases/*": {
+                    "max_retries": 8,
+                    "base_delay": 0.5,
+                    "max_delay": 4.0,
+                    "statuses": LDTransport.RETRY_STATUSES | {400, 409},
+                },
+            },
+        )
+
     ##################################################
     # Create a project
     ##################################################
-    def create_project(self, project_key, project_name):
+    def create_project(self, project_key, project_name, tags=None):
         self.project_key = project_key
         if self.project_exists(project_key):
             return
@@ -73,6 +521,8 @@ class LDPlatform:
                 "usingMobileKey": True,
             },
         }
+        if tags:
+            payload["tags"] = tags
 
         response = self.getrequest(
             "POST",
@@ -131,6 +581,26 @@ class LDPlatform:
         )
         return response
     
+    ##################################################
+    # Get the SDK key and client-side ID of an environment
+    ##################################################
+    def get_environment_keys(self, env_key="production"):
+        res = self.getrequest(
+            "GET",
+            "https://app.launchdarkly.com/api/v2/projects/"
+            + self.project_key
+            + "/environments/"
+            + env_key,
+            headers={"Authorization": self.api_key},
+        )
+        data = json.loads(res.text)
+        if "message" in data:
+            print("Error getting environment keys: " + data["message"])
+            return None, None
+        self.client_id = data["_id"]
+        self.sdk_key = data["apiKey"]
+        return self.client_id, self.sdk_key
+
     ##################################################
     # Create an environment
     ##################################################
@@ -157,6 +627,56 @@ class LDPlatform:
             "https://app.launchdarkly.com/api/v2/projects/" + self.project_key,
             headers={"Authorization": self.api_key},
         )
+        # Every cached resource belonged to the deleted project
+        self.response_cache.clear()
+        self.flag_catalog.clear()
+        self.ai_config_catalog.clear()
+        self.pipeline_phases.clear()
+        with self.patch_lock:
+            self.maintained.clear()
+        if self.inventory is not None:
+            self.inventory.reset()
+
+    ##################################################
+    # List projects
+    ##################################################
+    def list_projects(self, tag=None, page_size=20, query=None):
+        """
+        Every project tagged with tag, or whose key or name contains query.
+        Not cached, as tags change as projects are claimed.
+        """
+        projects = []
+        while True:
+            res = self.getrequest(
+                "GET",
+                "https://app.launchdarkly.com/api/v2/projects?filter="
+                + ("tags:" + tag if tag is not None else "query:" + query)
+                + "&limit="
+                + str(page_size)
+                + "&offset="
+                + str(len(projects)),
+                headers={"Authorization": self.api_key},
+                cache=False,
+            )
+            data = json.loads(res.text)
+            if "message" in data:
+                print("Error listing projects: " + data["message"])
+                return projects
+            projects += data.get("items", [])
+            if not data.get("items") or len(projects) >= data.get("totalCount", 0):
+                return projects
+
+    ##################################################
+    # Patch a project
+    ##################################################
+    def patch_project(self, project_key, patch):
+        """Apply a JSON patch to a project. A failing "test" operation leaves it unchanged."""
+        return self.getrequest(
+            "PATCH",
+            "https://app.launchdarkly.com/api/v2/projects/" + project_key,
+            json=patch,
+            headers={"Authorization": self.api_key, "Content-Type": "application/json"},
+        )
 
     ##################################################
     # Create a flag
@@ -175,7 +695,7 @@ class LDPlatform:
         prerequisites=[],
         temporary=False,
     ):
-        if self.flag_exists(flag_key):
+        if not self.optimistic_create and self.flag_exists(flag_key):
             return
 
         payload = {
@@ -222,33 +742,33 @@ class LDPlatform:
             "https://app.launchdarkly.com/api/v2/flags/" + self.project_key,
             json=payload,
             headers=headers,
+            idempotent=True,
         )
+        if response.status_code == 409 and (self.optimistic_create or self.replayed(response)):
+            # Already exists
+            self.resolve_create_conflict(
+                "flags", flag_key, payload,
+                "https://app.launchdarkly.com/api/v2/flags/" + self.project_key + "/" + flag_key,
+            )
+            return response
         data = json.loads(response.text)
         if "message" in data:
             print("Error creating flag: " + data["message"])
+        elif self.inventory is not None:
+            self.inventory.add("flags", flag_key, data)
         return response
     
     ##################################################
     # Update a flag
     ##################################################
     def update_flag_client_side_availability(self, flag_key):
-
-        payload = {
-            "instructions": [ 
-                { 
-                    "kind": "turnOnClientSideAvailability", "value": "usingEnvironmentId" 
-                } 
-            ]
-        }
-        
-        headers = {
-            "Authorization": self.api_key,
-            "Content-Type": "application/json; domain-model=launchdarkly.semanticpatch",
-        }
-                                             
-        url = "https://app.launchdarkly.com/api/v2/flags/" + self.project_key + "/" + flag_key
-        res = self.getrequest("PATCH", url, headers=headers, json=payload)        
-        return res
+        instructions = [
+            {
+                "kind": "turnOnClientSideAvailability", "value": "usingEnvironmentId"
+            }
+        ]
+        # Client-side availability is flag level, so it has no environment
+        return self.patch_flag(flag_key, None, instructions, idempotent=True)
 
     ##################################################
     # Copy a flag
@@ -515,7 +1035,7 @@ class LDPlatform:
     ##################################################
 
     def create_segment(self, segment_key, segment_name, env_key, description=""):
-        if self.segment_exists(segment_key, env_key):
+        if not self.optimistic_create and self.segment_exists(segment_key, env_key):
             return
 
         payload = {
@@ -537,16 +1057,43 @@ class LDPlatform:
             + env_key,
             json=payload,
             headers=headers,
+            idempotent=True,
         )
+        if response.status_code == 409 and (self.optimistic_create or self.replayed(response)):
+            # Already exists
+            self.resolve_create_conflict(
+                "segments", segment_key, payload,
+                "https://app.launchdarkly.com/api/v2/segments/" + self.project_key + "/" + env_key + "/" + segment_key,
+                env_key,
+            )
+            return response
         data = json.loads(response.text)
         if "message" in data:
             print("Error creating segment: " + data["message"])
+        elif self.inventory is not None:
+            self.inventory.add("segments", segment_key, data, env_key)
         return response
 
     ##################################################
     # Add a segment rule
     ##################################################
 
+    @staticmethod
+    def segment_rule(context_kind, attribute, op, value):
+        return {
+            "clauses": [
+                {
+                    "contextKind": context_kind,
+                    "op": op,
+                    "attribute": attribute,
+                    "values": value,
+                    "negate": False,
+                }
+            ],
+            "rolloutContextKind": "user",
+            "description": "",
+        }
+
     def add_segment_rule(
         self, segment_key, env_key, context_kind, attribute, op, value
     ):
@@ -554,19 +1101,7 @@ class LDPlatform:
             {
                 "op": "add",
                 "path": "/rules/0",
-                "value": {
-                    "clauses": [
-                        {
-                            "contextKind": context_kind,
-                            "op": op,
-                            "attribute": attribute,
-                            "values": value,
-                            "negate": False,
-                        }
-                    ],
-                    "rolloutContextKind": "user",
-                    "description": "",
-                },
+                "value": self.segment_rule(context_kind, attribute, op, value),
             },
         ]
 
@@ -607,7 +1142,7 @@ class LDPlatform:
         randomization_units=[],
         tags=[],
     ):
-        if self.metric_exists(metric_key):
+        if not self.optimistic_create and self.metric_exists(metric_key):
             return
 
         payload = {
@@ -640,10 +1175,20 @@ class LDPlatform:
             "https://app.launchdarkly.com/api/v2/metrics/" + self.project_key,
             json=payload,
             headers=headers,
+            idempotent=True,
         )
+        if response.status_code == 409 and (self.optimistic_create or self.replayed(response)):
+            # Already exists
+            self.resolve_create_conflict(
+                "metrics", metric_key, payload,
+                "https://app.launchdarkly.com/api/v2/metrics/" + self.project_key + "/" + metric_key,
+            )
+            return response
         data = json.loads(response.text)
         if "message" in data:
             print("Error creating metric: " + data["message"])
+        elif self.inventory is not None:
+            self.inventory.add("metrics", metric_key, data)
         return response
 
     ##################################################
@@ -652,7 +1197,7 @@ class LDPlatform:
     def create_metric_group(
         self, group_key, group_name, metrics, kind="funnel", description=""
     ):
-        if self.metric_group_exists(group_key):
+        if not self.optimistic_create and self.metric_group_exists(group_key):
             return
 
         payload = {
@@ -677,10 +1222,20 @@ class LDPlatform:
             + "/metric-groups",
             json=payload,
             headers=headers,
+            idempotent=True,
         )
+        if response.status_code == 409 and (self.optimistic_create or self.replayed(response)):
+            # Already exists
+            self.resolve_create_conflict(
+                "metric-groups", group_key, payload,
+                "https://app.launchdarkly.com/api/v2/projects/" + self.project_key + "/metric-groups/" + group_key,
+            )
+            return response
         data = json.loads(response.text)
         if "message" in data:
             print("Error creating metric group: " + data["message"])
+        elif self.inventory is not None:
+            self.inventory.add("metric-groups", group_key, data)
         return response
 
     ##################################################
@@ -797,9 +1352,12 @@ class LDPlatform:
         analysisConfig={"bayesianThreshold": "95"},
         flagConfigVersion=1,
     ):
-        if self.experiment_exists(exp_key, exp_env):
+        if not self.optimistic_create and self.experiment_exists(exp_key, exp_env):
             return
 
+        # flagConfigVersion counts on queued changes to the flag having landed
+        self.flush_flag_patches(flag_key)
+
         treatments = self.get_treatments(flag_key, custom_treatment_names)
 
         payload = {
@@ -846,10 +1404,21 @@ class LDPlatform:
             + "/experiments",
             json=payload,
             headers=headers,
+            idempotent=True,
         )
+        if response.status_code == 409 and (self.optimistic_create or self.replayed(response)):
+            # Already exists
+            self.resolve_create_conflict(
+                "experiments", exp_key, payload,
+                "https://app.launchdarkly.com/api/v2/projects/" + self.project_key + "/environments/" + exp_env + "/experiments/" + exp_key,
+                exp_env,
+            )
+            return response
         data = json.loads(response.text)
         if "message" in data:
             print("Error creating experiment: " + data["message"])
+        elif self.inventory is not None:
+            self.inventory.add("experiments", exp_key, data, exp_env)
         return response
 
     ##################################################
@@ -980,7 +1549,7 @@ class LDPlatform:
     # Create a release pipeline
     ##################################################
     def create_release_pipeline(self, pipeline_key, pipeline_name):
-        if self.release_pipeline_exists(pipeline_key):
+        if not self.optimistic_create and self.release_pipeline_exists(pipeline_key):
             return
 
         payload = {
@@ -1043,10 +1612,24 @@ class LDPlatform:
             + "/release-pipelines",
             json=payload,
             headers=headers,
+            idempotent=True,
         )
+        if response.status_code == 409 and (self.optimistic_create or self.replayed(response)):
+            # Already exists
+            self.resolve_create_conflict(
+                "release-pipelines", pipeline_key, payload,
+                "https://app.launchdarkly.com/api/v2/projects/" + self.project_key + "/release-pipelines/" + pipeline_key,
+            )
+            return response
         data = json.loads(response.text)
         if "message" in data:
             print("Error creating release pipeline: " + data["message"])
+            return response
+        if self.inventory is not None:
+            self.inventory.add("release-pipelines", pipeline_key, data)
+        # The new pipeline's phase IDs come with it
+        if data.get("phases"):
+            self.pipeline_phases[pipeline_key] = self.phase_ids_of(data)
         return response
 
     def create_shortcut(self, name, key, icon, tags, env_key, sort_by="name"):
@@ -1098,7 +1681,13 @@ class LDPlatform:
     def get_user_id(self, email):
         if email is None:
             return None
-        
+        user_id = self.member_directory.get(email, lambda: self.lookup_user_id(email))
+        if user_id is None:
+            return "6502137e3310e112c47aeb92"
+        self.user_id = user_id
+        return self.user_id
+
+    def lookup_user_id(self, email):
         filter = "email:" + email
         if email == "":
             filter = "role:owner"
@@ -1113,7 +1702,7 @@ class LDPlatform:
         if res.status_code != 200:
             print(f"Error getting user ID: HTTP {res.status_code}")
             print(f"Response: {res.text}")
-            return "6502137e3310e112c47aeb92"
+            return None
         
         # Parse response with error handling
         try:
@@ -1122,26 +1711,28 @@ class LDPlatform:
             print(f"JSON decode error: {e}")
             print(f"Response status: {res.status_code}")
             print(f"Response text: {res.text[:500]}...")
-            return "6502137e3310e112c47aeb92"
+            return None
         
         # Check if response contains expected data structure
         if "totalCount" not in data or "items" not in data:
             print(f"Error: Response does not contain expected keys")
             print(f"Response status: {res.status_code}")
             print(f"Response: {res.text[:500]}...")
-            return "6502137e3310e112c47aeb92"
+            return None
             
         if data["totalCount"] == 0:
-            return "6502137e3310e112c47aeb92"
+            return None
 
-        self.user_id = data["items"][0]["_id"]
-        return self.user_id
+        return data["items"][0]["_id"]
 
     ##################################################
     # Check if a project exists
     ##################################################
 
     def project_exists(self, project_key):
+        return self.get_project(project_key) is not None
+
+    def get_project(self, project_key):
         res = self.getrequest(
             "GET",
             "https://app.launchdarkly.com/api/v2/projects/" + project_key,
@@ -1149,8 +1740,8 @@ class LDPlatform:
         )
         data = json.loads(res.text)
         if "message" in data:
-            return False
-        return True
+            return None
+        return data
     
     ##################################################
     # Create a user
@@ -1184,6 +1775,10 @@ class LDPlatform:
     # Check if a flag exists
     ##################################################
     def flag_exists(self, flag_key):
+        if self.flag_catalog.get(flag_key) is not None:
+            return True
+        if self.inventory is not None:
+            return self.inventory.contains("flags", flag_key)
         res = self.getrequest(
             "GET",
             "https://app.launchdarkly.com/api/v2/flags/"
@@ -1202,6 +1797,8 @@ class LDPlatform:
     ##################################################
 
     def segment_exists(self, segment_key, env_key):
+        if self.inventory is not None:
+            return self.inventory.contains("segments", segment_key, env_key)
         res = self.getrequest(
             "GET",
             "https://app.launchdarkly.com/api/v2/segments/"
@@ -1220,6 +1817,8 @@ class LDPlatform:
     # Check if a metric exists
     ##################################################
     def metric_exists(self, metric_key):
+        if self.inventory is not None:
+            return self.inventory.contains("metrics", metric_key)
         res = self.getrequest(
             "GET",
             "https://app.launchdarkly.com/api/v2/metrics/"
@@ -1237,6 +1836,8 @@ class LDPlatform:
     # Check if a metric group exists
     ##################################################
     def metric_group_exists(self, group_key):
+        if self.inventory is not None:
+            return self.inventory.contains("metric-groups", group_key)
         res = self.getrequest(
             "GET",
             "https://app.launchdarkly.com/api/v2/projects/"
@@ -1254,6 +1855,8 @@ class LDPlatform:
     # Check if an experiment exists
     ##################################################
     def experiment_exists(self, exp_key, exp_env):
+        if self.inventory is not None:
+            return self.inventory.contains("experiments", exp_key, exp_env)
         res = self.getrequest(
             "GET",
             "https://app.launchdarkly.com/api/v2/projects/"
@@ -1273,10 +1876,12 @@ class LDPlatform:
     # Check if a release pipeline exists
     ##################################################
     def release_pipeline_exists(self, pipeline_key):
+        if self.inventory is not None:
+            return self.inventory.contains("release-pipelines", pipeline_key)
         url = (
             "https://app.launchdarkly.com/api/v2/projects/"
             + self.project_key
-            + "/release-pipelines"
+            + "/release-pipelines/"
             + pipeline_key
         )
         res = self.getrequest(
@@ -1308,11 +1913,18 @@ class LDPlatform:
             ],
         }
 
-    #########################################################
-    # Get the flag variation IDs with values, returns a list
-    #########################################################
-    def get_flag_variation_values(self, flag_key):
-        var_ids = []
+    ##################################################
+    # Get a flag's variations from the catalog
+    ##################################################
+    def get_flag_entry(self, flag_key):
+        """
+        Return the catalog entry for flag_key, fetching the flag only if it
+        was not created or patched through this client. None if the flag
+        could not be read.
+        """
+        entry = self.flag_catalog.get(flag_key)
+        if entry is not None:
+            return entry
 
         url = (
             "https://app.launchdarkly.com/api/v2/flags/"
@@ -1325,139 +1937,88 @@ class LDPlatform:
             "Content-Type": "application/json",
         }
         res = self.getrequest("GET", url, headers=headers)
-        
-        # Check if the response is successful
         if res.status_code != 200:
-            print(f"Error getting flag variation values: HTTP {res.status_code}")
+            print(f"Error getting flag {flag_key}: HTTP {res.status_code}")
             print(f"Response: {res.text}")
-            return [], {"onVariation": 0, "offVariation": 0}
-        
-        # Parse response with error handling
+            return None
         try:
             data = json.loads(res.text)
         except json.JSONDecodeError as e:
             print(f"JSON decode error: {e}")
-            print(f"Response status: {res.status_code}")
             print(f"Response text: {res.text[:500]}...")
+            return None
+        entry = self.flag_catalog.seed(data)
+        if entry is None:
+            print(f"Error: flag {flag_key} has no variations")
+        return entry
+
+    #########################################################
+    # Get the flag variation IDs with values, returns a list
+    #########################################################
+    def get_flag_variation_values(self, flag_key):
+        entry = self.get_flag_entry(flag_key)
+        if entry is None:
             return [], {"onVariation": 0, "offVariation": 0}
-        
-        # Check if response contains expected data structure
-        if "defaults" not in data or "variations" not in data:
-            print(f"Error: Response does not contain expected keys")
-            print(f"Response status: {res.status_code}")
-            print(f"Response: {res.text[:500]}...")
-            return [], {"onVariation": 0, "offVariation": 0}
-        
+
+        var_ids = [
+            {"ordinal": var.ordinal, "value": var.value, "id": var.id}
+            for var in entry.variations
+        ]
         defaults = {
-            "onVariation": data["defaults"]["onVariation"],
-            "offVariation": data["defaults"]["offVariation"],
+            "onVariation": entry.on_variation,
+            "offVariation": entry.off_variation,
         }
-        ordinal = 0
-        for var in data["variations"]:
-            var_ids.append(
-                {"ordinal": ordinal, "value": var["value"], "id": var["_id"]}
-            )
-            ordinal += 1
-
         return var_ids, defaults
 
     ##################################################
-    # Get flag variation names from LaunchDarkly API
+    # Get flag variation names
     ##################################################
     def get_flag_variation_names(self, flag_key, segment=False):
         """
-        Get the names of flag variations from LaunchDarkly API
+        Get the names of flag variations
         Returns a list of variation names (excluding 'disabled' unless segment=True)
         """
-        url = (
-            "https://app.launchdarkly.com/api/v2/flags/"
-            + self.project_key
-            + "/"
-            + flag_key
-        )
-        headers = {
-            "Authorization": self.api_key,
-            "Content-Type": "application/json",
-        }
-        res = self.getrequest("GET", url, headers=headers)
-        data = json.loads(res.text)
-        if "variations" not in data:
+        entry = self.get_flag_entry(flag_key)
+        if entry is None:
             return []
-        
-        variation_names = []
-        for var in data["variations"]:
-            # If segment is True, include all variations (including "disabled")
-            # If segment is False, exclude "disabled" as before
-            if segment or var["name"] != "disabled":
-                variation_names.append(var["name"])
-        
-        return variation_names
+        return [
+            var.name
+            for var in entry.variations
+            if segment or var.name != "disabled"
+        ]
 
     ##################################################
-    # Get flag variation details (names and IDs) from LaunchDarkly API
+    # Get flag variation details (names and IDs)
     ##################################################
     def get_flag_variation_details(self, flag_key, segment=False):
         """
-        Get both names and IDs of flag variations from LaunchDarkly API
+        Get both names and IDs of flag variations
         Returns a list of dictionaries with 'name' and 'id' keys
         """
-        url = (
-            "https://app.launchdarkly.com/api/v2/flags/"
-            + self.project_key
-            + "/"
-            + flag_key
-        )
-        headers = {
-            "Authorization": self.api_key,
-            "Content-Type": "application/json",
-        }
-        res = self.getrequest("GET", url, headers=headers)
-        data = json.loads(res.text)
-        if "variations" not in data:
+        entry = self.get_flag_entry(flag_key)
+        if entry is None:
             return []
-        
-        variation_details = []
-        for var in data["variations"]:
-            # If segment is True, include all variations (including "disabled")
-            # If segment is False, exclude "disabled" as before
-            if segment or var["name"] != "disabled":
-                variation_details.append({
-                    "name": var["name"],
-                    "id": var["_id"],
-                    "value": var.get("value", None)
-                })
-        
-        return variation_details
+        return [
+            {"name": var.name, "id": var.id, "value": var.value}
+            for var in entry.variations
+            if segment or var.name != "disabled"
+        ]
 
     ##################################################
     # Get the flag variation IDs, returns a list
     ##################################################
     def get_flag_variations(self, flag_key, filter=None, segment=False):
-        var_ids = []
-        url = (
-            "https://app.launchdarkly.com/api/v2/flags/"
-            + self.project_key
-            + "/"
-            + flag_key
-        )
-        headers = {
-            "Authorization": self.api_key,
-            "Content-Type": "application/json",
-        }
-        res = self.getrequest("GET", url, headers=headers)
-        data = json.loads(res.text)
-        if "variations" not in data:
+        entry = self.get_flag_entry(flag_key)
+        if entry is None:
             return []
-        for var in data["variations"]:
-            # If segment is True, include all variations (including "disabled")
-            # If segment is False, exclude "disabled" as before
-            if segment or var["name"] != "disabled":
-                if filter is not None:
-                    if var["value"] == filter:
-                        var_ids.append(var["_id"])
-                else:
-                    var_ids.append(var["_id"])
-        return var_ids
+        # If segment is True, include all variations (including "disabled")
+        # If segment is False, exclude "disabled" as before
+        return [
+            var.id
+            for var in entry.variations
+            if (segment or var.name != "disabled")
+            and (filter is None or var.value == filter)
+        ]
 
     ##################################################
     # Create a list of treatments, returns a list
@@ -1554,71 +2115,56 @@ class LDPlatform:
             else:
                 test_var = v["id"]
 
-        url = (
-            "https://app.launchdarkly.com/api/v2/flags/"
-            + self.project_key
-            + "/"
-            + flag_key
-            + "?ignoreConflicts=true"
-        )
-        headers = {
-            "Authorization": self.api_key,
-            "Content-Type": "application/json; domain-model=launchdarkly.semanticpatch",
-        }
-        payload = {
-            "comment": "",
-            "environmentKey": env_key,
-            "instructions": [
-                {
-                    "kind": "turnFlagOn"
-                },
-                {
-                    "kind": "updateFallthroughWithMeasuredRolloutV2",
-                    "testVariationId": test_var,
-                    "metrics": [
+        instructions = [
+            {
+                "kind": "turnFlagOn"
+            },
+            {
+                "kind": "updateFallthroughWithMeasuredRolloutV2",
+                "testVariationId": test_var,
+                "metrics": [
+                    {
+                        "metricKey": metric,
+                        "regressionThreshold": 0,
+                        "onRegression": {
+                            "rollback": True,
+                            "notify": True
+                        }
+                    } for metric in metrics
+                ],
+                "controlVariationId": control_var,
+                "randomizationUnit": "user",
+                "onRegression": {"notify": notify, "rollback": rollback},
+                "onProgression": {"notify": notify, "rollForward": True},
+                "monitoringWindowMilliseconds": timeout,
+                "rolloutWeight": weight,
+                "metricKeys": metrics,
+                "stages": [
                         {
-                            "metricKey": metric,
-                            "regressionThreshold": 0,
-                            "onRegression": {
-                                "rollback": True,
-                                "notify": True
-                            }
-                        } for metric in metrics
-                    ],
-                    "controlVariationId": control_var,
-                    "randomizationUnit": "user",
-                    "onRegression": {"notify": notify, "rollback": rollback},
-                    "onProgression": {"notify": notify, "rollForward": True},
-                    "monitoringWindowMilliseconds": timeout,
-                    "rolloutWeight": weight,
-                    "metricKeys": metrics,
-                    "stages": [
-                            {
-                                "rolloutWeight": 1000,
-                                "monitoringWindowMilliseconds": stagesWindow
-                            },
-                            {
-                                "rolloutWeight": 5000,
-                                "monitoringWindowMilliseconds": stagesWindow
-                            },
-                            {
-                                "rolloutWeight": 10000,
-                                "monitoringWindowMilliseconds": stagesWindow
-                            },
-                            {
-                                "rolloutWeight": 25000,
-                                "monitoringWindowMilliseconds": stagesWindow
-                            },
-                            {
-                                "rolloutWeight": 50000,
-                                "monitoringWindowMilliseconds": stagesWindow
-                            },         
-                    ]
-                }
-            ],
-        }
-        res = self.getrequest("PATCH", url, headers=headers, json=payload)
-        return res
+                            "rolloutWeight": 1000,
+                            "monitoringWindowMilliseconds": stagesWindow
+                        },
+                        {
+                            "rolloutWeight": 5000,
+                            "monitoringWindowMilliseconds": stagesWindow
+                        },
+                        {
+                            "rolloutWeight": 10000,
+                            "monitoringWindowMilliseconds": stagesWindow
+                        },
+                        {
+                            "rolloutWeight": 25000,
+                            "monitoringWindowMilliseconds": stagesWindow
+                        },
+                        {
+                            "rolloutWeight": 50000,
+                            "monitoringWindowMilliseconds": stagesWindow
+                        },         
+                ]
+            }
+        ]
+
+        return self.patch_flag(flag_key, env_key, instructions, "", ignore_conflicts=True)
     
     ##################################################
     # Add a guarded rollout to a flag
@@ -1643,85 +2189,70 @@ class LDPlatform:
             else:
                 end_var = v["id"]
 
-        url = (
-            "https://app.launchdarkly.com/api/v2/flags/"
-            + self.project_key
-            + "/"
-            + flag_key
-            + "?ignoreConflicts=true"
-        )
-        headers = {
-            "Authorization": self.api_key,
-            "Content-Type": "application/json; domain-model=launchdarkly.semanticpatch",
-        }
-        payload = {
-            "comment": "",
-            "environmentKey": env_key,
-            "instructions": [
-                {
-                    "kind": "turnFlagOn"
-                },
-                {
-                    "kind": "updateFallthroughVariationOrRollout",
-                    "rolloutContextKind": "user",
-                    "progressiveRolloutConfiguration": {
-                        "controlVariationId": control_var,
-                        "endVariationId": end_var,
-                        "stages": [
-                            {
-                                "displayUnit": "day",
-                                "durationMs": timeout,
-                                "rollout": {
-                                    end_var: 1000,
-                                    control_var: 99000,
-                                }
-                            },
-                            {
-                                "displayUnit": "day",
-                                "durationMs": timeout,
-                                "rollout": {
-                                    end_var: 5000,
-                                    control_var: 95000,
-                                }
-                            },
-                            {
-                                "displayUnit": "day",
-                                "durationMs": timeout,
-                                "rollout": {
-                                    end_var: 10000,
-                                    control_var: 90000,
-                                }
-                            },
-                            {
-                                "displayUnit": "day",
-                                "durationMs": timeout,
-                                "rollout": {
-                                    end_var: 25000,
-                                    control_var: 75000,
-                                }
-                            },
-                            {
-                                "displayUnit": "day",
-                                "durationMs": timeout,
-                                "rollout": {
-                                    end_var: 50000,
-                                    control_var: 50000,
-                                }
-                            },
-                            {
-                                "displayUnit": "day",
-                                "rollout": {
-                                    end_var: 100000,
-                                    control_var: 0,
-                                }
+        instructions = [
+            {
+                "kind": "turnFlagOn"
+            },
+            {
+                "kind": "updateFallthroughVariationOrRollout",
+                "rolloutContextKind": "user",
+                "progressiveRolloutConfiguration": {
+                    "controlVariationId": control_var,
+                    "endVariationId": end_var,
+                    "stages": [
+                        {
+                            "displayUnit": "day",
+                            "durationMs": timeout,
+                            "rollout": {
+                                end_var: 1000,
+                                control_var: 99000,
                             }
-                        ]
-                    }
+                        },
+                        {
+                            "displayUnit": "day",
+                            "durationMs": timeout,
+                            "rollout": {
+                                end_var: 5000,
+                                control_var: 95000,
+                            }
+                        },
+                        {
+                            "displayUnit": "day",
+                            "durationMs": timeout,
+                            "rollout": {
+                                end_var: 10000,
+                                control_var: 90000,
+                            }
+                        },
+                        {
+                            "displayUnit": "day",
+                            "durationMs": timeout,
+                            "rollout": {
+                                end_var: 25000,
+                                control_var: 75000,
+                            }
+                        },
+                        {
+                            "displayUnit": "day",
+                            "durationMs": timeout,
+                            "rollout": {
+                                end_var: 50000,
+                                control_var: 50000,
+                            }
+                        },
+                        {
+                            "displayUnit": "day",
+                            "rollout": {
+                                end_var: 100000,
+                                control_var: 0,
+                            }
+                        }
+                    ]
                 }
-            ],
-        }
-        res = self.getrequest("PATCH", url, headers=headers, json=payload)
-        return res
+            }
+        ]
+
+        return self.patch_flag(flag_key, env_key, instructions, "", ignore_conflicts=True)
 
     ##################################################
     # Toggle flag state
@@ -1733,28 +2264,15 @@ class LDPlatform:
         else:
             cmd = "turnFlagOff"
 
-        url = (
-            "https://app.launchdarkly.com/api/v2/flags/"
-            + self.project_key
-            + "/"
-            + flag_key
-        )
-        headers = {
-            "Authorization": self.api_key,
-            "Content-Type": "application/json; domain-model=launchdarkly.semanticpatch",
-        }
-        payload = {"environmentKey": flag_env, "instructions": [{"kind": cmd}]}
-        if comment is not None:
-            payload["comment"] = comment
-
-        res = self.getrequest("PATCH", url, headers=headers, json=payload)
-        return res
+        return self.patch_flag(flag_key, flag_env, [{"kind": cmd}], comment, idempotent=True)
 
     ##################################################
     # Add a maintainerId to flag
     ##################################################
 
     def add_maintainer_to_flag(self, flag_key):
+        if self.has_maintainer("flags", flag_key):
+            return None
         url = (
             "https://app.launchdarkly.com/api/v2/flags/"
             + self.project_key
@@ -1773,7 +2291,8 @@ class LDPlatform:
             }
         ]
 
-        res = self.getrequest("PATCH", url, headers=headers, json=payload)
+        res = self.getrequest("PATCH", url, headers=headers, json=payload, idempotent=True)
+        self.record_maintainer("flags", flag_key, res)
         return res
 
     ##################################################
@@ -1781,6 +2300,8 @@ class LDPlatform:
     ##################################################
 
     def add_maintainer_to_metric(self, metric_key):
+        if self.has_maintainer("metrics", metric_key):
+            return None
         url = (
             "https://app.launchdarkly.com/api/v2/metrics/"
             + self.project_key
@@ -1799,47 +2320,105 @@ class LDPlatform:
             }
         ]
 
-        res = self.getrequest("PATCH", url, headers=headers, json=payload)
+        res = self.getrequest("PATCH", url, headers=headers, json=payload, idempotent=True)
+        self.record_maintainer("metrics", metric_key, res)
         return res
 
     ##################################################
-    # Add segment to flag
+    # Add a maintainerId to AI config
     ##################################################
 
-    def add_segment_to_flag(self, flag_key, segment_key, env_key, variation=True, segment=False):
+    def add_maintainer_to_ai_config(self, ai_config_key):
+        if self.has_maintainer("ai-configs", ai_config_key):
+            return None
         url = (
-            "https://app.launchdarkly.com/api/v2/flags/"
+            "https://app.launchdarkly.com/api/v2/projects/"
             + self.project_key
-            + "/"
-            + flag_key
+            + "/ai-configs/"
+            + ai_config_key
         )
         headers = {
             "Authorization": self.api_key,
-            "Content-Type": "application/json; domain-model=launchdarkly.semanticpatch",
-        }
-        var_id = self.get_flag_variations(flag_key, None, segment)[0]
-        payload = {
-            "environmentKey": env_key,
-            "instructions": [
-                {
-                    "kind": "addRule",
-                    "variationId": var_id,
-                    "clauses": [
-                        {
-                            "contextKind": "",
-                            "attribute": "segmentMatch",
-                            "op": "segmentMatch",
-                            "negate": False,
-                            "values": [segment_key],
-                        }
-                    ],
-                }
-            ],
+            "Content-Type": "application/json",
+            "LD-API-Version": "beta",
         }
+        payload = {"maintainerId": self.user_id}
 
-        res = self.getrequest("PATCH", url, headers=headers, json=payload)
+        res = self.getrequest("PATCH", url, headers=headers, json=payload, idempotent=True)
+        self.record_maintainer("ai-configs", ai_config_key, res)
         return res
 
+    ##################################################
+    # Assign the maintainer to many resources at once
+    ##################################################
+
+    def assign_maintainers(self, flags=(), metrics=(), ai_configs=(), max_workers=8):
+        """
+        Make user_id the maintainer of the given flags, metrics and AI
+        configs. Resources already created or patched with that maintainer
+        are skipped and the rest are patched concurrently, paced by the rate
+        limiter. Returns {(resource type, key): response}, with None for
+        skipped resources.
+        """
+        jobs = (
+            [("flags", key, self.add_maintainer_to_flag) for key in flags]
+            + [("metrics", key, self.add_maintainer_to_metric) for key in metrics]
+            + [("ai-configs", key, self.add_maintainer_to_ai_config) for key in ai_configs]
+        )
+        results = {}
+        pending = []
+        for resource_type, key, assign in jobs:
+            if self.has_maintainer(resource_type, key):
+                results[(resource_type, key)] = None
+            else:
+                pending.append((resource_type, key, assign))
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+                futures = {
+                    (resource_type, key): executor.submit(LDScheduler.in_current_task(assign), key)
+                    for resource_type, key, assign in pending
+                }
+            for job, future in futures.items():
+                res = future.result()
+                results[job] = res
+                if res is not None and res.status_code != 200:
+                    print(f"Error setting maintainer on {job[0]} {job[1]}: HTTP {res.status_code}")
+        return results
+
+    def has_maintainer(self, resource_type, key):
+        with self.patch_lock:
+            return (resource_type, key) in self.maintained
+
+    def record_maintainer(self, resource_type, key, response):
+        if response.status_code == 200:
+            with self.patch_lock:
+                self.maintained.add((resource_type, key))
+
+    ##################################################
+    # Add segment to flag
+    ##################################################
+
+    def add_segment_to_flag(self, flag_key, segment_key, env_key, variation=True, segment=False):
+        var_id = self.get_flag_variations(flag_key, None, segment)[0]
+        instructions = [
+            {
+                "kind": "addRule",
+                "variationId": var_id,
+                "clauses": [
+                    {
+                        "contextKind": "",
+                        "attribute": "segmentMatch",
+                        "op": "segmentMatch",
+                        "negate": False,
+                        "values": [segment_key],
+                    }
+                ],
+            }
+        ]
+
+        return self.patch_flag(flag_key, env_key, instructions)
+
     ##################################################
     # Add prequisite to flag
     ##################################################
@@ -1847,29 +2426,15 @@ class LDPlatform:
     def add_prerequisite_to_flag(self, flag_key, prerequisite_key, var_id, env_key):
         varids = self.get_flag_variations(prerequisite_key)
 
-        url = (
-            "https://app.launchdarkly.com/api/v2/flags/"
-            + self.project_key
-            + "/"
-            + flag_key
-        )
-        headers = {
-            "Authorization": self.api_key,
-            "Content-Type": "application/json; domain-model=launchdarkly.semanticpatch",
-        }
-        payload = {
-            "environmentKey": env_key,
-            "instructions": [
-                {
-                    "kind": "addPrerequisite",
-                    "prerequisiteKey": prerequisite_key,
-                    "variationId": varids[var_id],
-                }
-            ],
-        }
+        instructions = [
+            {
+                "kind": "addPrerequisite",
+                "prerequisiteKey": prerequisite_key,
+                "variationId": varids[var_id],
+            }
+        ]
 
-        res = self.getrequest("PATCH", url, headers=headers, json=payload)
-        return res
+        return self.patch_flag(flag_key, env_key, instructions)
 
     ##################################################
     # Start experiment iteration
@@ -1904,12 +2469,13 @@ class LDPlatform:
     ##################################################
     # Add a flag to a pipeline
     ##################################################
-    def add_pipeline_flag(self, flag_key, pipeline_key):
-        var_ids = self.get_flag_variations(flag_key)
-        if not var_ids:
-            print(f"Warning: No variations found for flag {flag_key}, skipping pipeline addition")
-            return None
-        var_id = var_ids[0]
+    def add_pipeline_flag(self, flag_key, pipeline_key, variation_id=None):
+        if variation_id is None:
+            var_ids = self.get_flag_variations(flag_key)
+            if not var_ids:
+                print(f"Warning: No variations found for flag {flag_key}, skipping pipeline addition")
+                return None
+            variation_id = var_ids[0]
         url = (
             "https://app.launchdarkly.com/api/v2/projects/"
             + self.project_key
@@ -1925,17 +2491,82 @@ class LDPlatform:
         }
 
         payload = {
-            "releaseVariationId": var_id,
+            "releaseVariationId": variation_id,
             "releasePipelineKey": pipeline_key,
         }
 
-        response = requests.put(url, json=payload, headers=headers)
+        response = self.getrequest("PUT", url, json=payload, headers=headers)
         return response
 
+    ##################################################
+    # Add many flags to a pipeline
+    ##################################################
+    def add_pipeline_flags(self, flag_keys, pipeline_key, max_workers=8):
+        """
+        Enroll flag_keys in pipeline_key. Release variation IDs come from the
+        flag catalog, topped up from the project's flag list, so only a flag
+        in neither is read on its own. The PUTs are sent concurrently, paced
+        by the rate limiter. Returns {flag key: (status, detail)}, where
+        status is "enrolled", "already enrolled" or "failed".
+        """
+        missing = {key for key in flag_keys if self.flag_catalog.get(key) is None}
+        if missing and self.inventory is not None:
+            for key, item in self.inventory.index("flags").items():
+                if key in missing:
+                    self.flag_catalog.seed(item)
+
+        results = {}
+        variation_ids = {}
+        for key in flag_keys:
+            var_ids = self.get_flag_variations(key)
+            if var_ids:
+                variation_ids[key] = var_ids[0]
+            else:
+                results[key] = ("failed", "no variations")
+
+        if variation_ids:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(variation_ids))) as executor:
+                futures = {
+                    key: executor.submit(LDScheduler.in_current_task(self.add_pipeline_flag), key, pipeline_key, var_id)
+                    for key, var_id in variation_ids.items()
+                }
+            for key, future in futures.items():
+                res = future.result()
+                if res.status_code in (200, 201):
+                    results[key] = ("enrolled", variation_ids[key])
+                elif res.status_code == 409:
+                    # Enrolled by an earlier, interrupted build
+                    results[key] = ("already enrolled", variation_ids[key])
+                else:
+                    try:
+                        detail = json.loads(res.text).get("message", f"HTTP {res.status_code}")
+                    except (json.JSONDecodeError, AttributeError):
+                        detail = f"HTTP {res.status_code}"
+                    results[key] = ("failed", detail)
+        return {key: results[key] for key in flag_keys}
+
+    ##################################################
+    # Get a flag's release
+    ##################################################
+    def get_flag_release(self, flag_key):
+        # Never cached, the phases change while a release is advanced
+        return self.getrequest(
+            "GET",
+            "https://app.launchdarkly.com/api/v2/projects/"
+            + self.project_key
+            + "/flags/"
+            + flag_key
+            + "/release",
+            headers={"Authorization": self.api_key, "LD-API-Version": "beta"},
+            cache=False,
+        )
+
     ##################################################
     # Get pipeline phase IDs
     ##################################################
     def get_pipeline_phase_ids(self, pipeline_key):
+        if pipeline_key in self.pipeline_phases:
+            return dict(self.pipeline_phases[pipeline_key])
         url = (
             "https://app.launchdarkly.com/api/v2/projects/"
             + self.project_key
@@ -1952,10 +2583,17 @@ class LDPlatform:
             },
         )
         data = json.loads(res.text)
+        phase_ids = self.phase_ids_of(data)
+        self.pipeline_phases[pipeline_key] = phase_ids
+        return dict(phase_ids)
+
+    @staticmethod
+    def phase_ids_of(pipeline):
+        # Phases are named by their position in the pipeline
         c = 0
         phases = ["test", "guard", "ga"]
         phase_ids = {}
-        for p in data["phases"]:
+        for p in pipeline["phases"]:
             id = p["id"]
             phase_ids.update({phases[c]: id})
             c += 1
@@ -1981,59 +2619,79 @@ class LDPlatform:
 
         payload = {"metricKeys": metric_keys}
 
-        response = requests.put(url, json=payload, headers=headers)
+        response = self.getrequest("PUT", url, json=payload, headers=headers)
         return response
 
+    def get_flag_metrics(self, flag_key):
+        """Keys of the metrics attached to a flag, or None if they could not be read."""
+        url = (
+            "https://app.launchdarkly.com/api/v2/projects/"
+            + self.project_key
+            + "/flags/"
+            + flag_key
+            + "/measured-rollout-configuration"
+        )
+        headers = {
+            "Authorization": self.api_key,
+            "LD-API-Version": "beta",
+        }
+        response = self.getrequest("GET", url, headers=headers)
+        if response.status_code == 404:
+            # Never configured
+            return []
+        if response.status_code != 200:
+            print(f"Error getting metrics of flag {flag_key}: HTTP {response.status_code}")
+            return None
+        data = response.json()
+        if "metricKeys" in data:
+            return data["metricKeys"] or []
+        return [metric.get("key") for metric in data.get("metrics") or []]
+
     ##################################################
     # Advance a flag to the next phase
     ##################################################
     def advance_flag_phase(self, flag_key, status, pipeline_phase_id, guarded=False):
-        counter = 0
-        status_code = 0
-        payload = {}
-        while status_code != 200:
-            counter += 1
-            url = (
-                "https://app.launchdarkly.com/api/v2/projects/"
-                + self.project_key
-                + "/flags/"
-                + flag_key
-                + "/release/phases/"
-                + pipeline_phase_id
-            )
-            
-            if guarded == True:
-                payload = {
-                    "status": status,
-                    "audiences": [
-						{
-							"audienceId": str(uuid.uuid4()),
-							"releaseGuardianConfiguration": {
-								"randomizationUnit": "user"
-							}
-						}
-					]
-                }
-                
-            else:
-                payload = {
-                    "status": status,
-                }
-    
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": self.api_key,
-                "LD-API-Version": "beta",
+        url = (
+            "https://app.launchdarkly.com/api/v2/projects/"
+            + self.project_key
+            + "/flags/"
+            + flag_key
+            + "/release/phases/"
+            + pipeline_phase_id
+        )
+
+        if guarded == True:
+            payload = {
+                "status": status,
+                "audiences": [
+                    {
+                        "audienceId": str(uuid.uuid4()),
+                        "releaseGuardianConfiguration": {
+                            "randomizationUnit": "user"
+                        }
+                    }
+                ]
             }
 
-            response = requests.put(url, json=payload, headers=headers)
-            status_code = response.status_code
-            if counter > 8:
-                break
-            if status_code != 200:
+        else:
+            payload = {
+                "status": status,
+            }
+
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": self.api_key,
+            "LD-API-Version": "beta",
+        }
+
+        # Retries while the previous phase settles come from the retry policy
+        response = self.getrequest("PUT", url, json=payload, headers=headers)
+        if response.status_code != 200:
+            try:
                 data = json.loads(response.text)
-                print("Error advancing flag phase: " + data["message"])
-                time.sleep(3)
+                print("Error advancing flag phase: " + data.get("message", response.text))
+            except json.JSONDecodeError:
+                print(f"Error advancing flag phase: HTTP {response.status_code}")
 
         return response
     
@@ -2065,7 +2723,7 @@ class LDPlatform:
             ]
         }
         
-        response = self.getrequest("PATCH", url, headers=headers, json=payload)
+        response = self.getrequest("PATCH", url, headers=headers, json=payload, idempotent=True)
         data = json.loads(response.text)
         if "message" in data:
             print("Error updating AI config targeting: " + data["message"])
@@ -2100,7 +2758,7 @@ class LDPlatform:
             ]
         }
         
-        response = self.getrequest("PATCH", url, headers=headers, json=payload)
+        response = self.getrequest("PATCH", url, headers=headers, json=payload, idempotent=True)
         data = json.loads(response.text)
         if "message" in data:
             print("Error toggling AI config: " + data["message"])
@@ -2110,6 +2768,19 @@ class LDPlatform:
     # Get AI Config Variation ID
     ##################################################
     def get_ai_config_variation_id(self, ai_config_key, variation_key):
+        variation = self.ai_config_catalog.variation(ai_config_key, variation_key)
+        if variation is None:
+            # Not created through this client, index the config once
+            if self.fetch_ai_config(ai_config_key) is None:
+                return None
+            variation = self.ai_config_catalog.variation(ai_config_key, variation_key)
+        if variation is None:
+            print(f"Variation with key '{variation_key}' not found")
+            return None
+        return variation.id
+
+    def fetch_ai_config(self, ai_config_key):
+        """GET an AI config and index its variations. Returns the config, or None on error."""
         url = (
             "https://app.launchdarkly.com/api/v2/projects/"
             + self.project_key
@@ -2128,14 +2799,8 @@ class LDPlatform:
         if "message" in data:
             print("Error getting AI config: " + data["message"])
             return None
-            
-        # Find the variation with the matching key
-        for variation in data.get("variations", []):
-            if variation.get("key") == variation_key:
-                return variation.get("_id")
-        
-        print(f"Variation with key '{variation_key}' not found")
-        return None
+        self.ai_config_catalog.seed_config(data)
+        return data
     
     ##################################################
     # Add guarded rollout to AI Agent
@@ -2265,32 +2930,22 @@ class LDPlatform:
     # Get AI Config Variations (excluding disabled)
     ##################################################
     def get_ai_config_variations(self, ai_config_key):
-        url = (
-            "https://app.launchdarkly.com/api/v2/projects/"
-            + self.project_key
-            + "/ai-configs/"
-            + ai_config_key
-        )
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": self.api_key,
-            "LD-API-Version": "beta",
-        }
-        
-        response = self.getrequest("GET", url, headers=headers)
-        data = json.loads(response.text)
-        if "message" in data:
-            print("Error getting AI config variations: " + data["message"])
-            return []
+        """
+        Return the config's variations as {"_id", "key", "name"} dicts,
+        excluding the disabled one
+        """
+        variations = self.ai_config_catalog.variations(ai_config_key)
+        if variations is None:
+            if self.fetch_ai_config(ai_config_key) is None:
+                return []
+            variations = self.ai_config_catalog.variations(ai_config_key) or []
             
         # Filter out disabled variations
-        variations = []
-        for variation in data.get("variations", []):
-            if variation.get("name", "").lower() != "disabled":
-                variations.append(variation)
-        
-        return variations
+        return [
+            variation.as_dict()
+            for variation in variations
+            if variation.name.lower() != "disabled"
+        ]
     
     ##################################################
     # Create Alert
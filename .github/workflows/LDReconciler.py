@@ -0,0 +1,556 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import LDInventory
+import LDPlatform
+import LDResultsGenerator
+import LDScheduler
+
+# Resource types removed when the manifest no longer has them, in the order
+# they are deleted. Experiments are never removed so their results are kept
+PRUNED_TYPES = ("metric-groups", "metrics", "segments", "ai-configs", "flags", "release-pipelines")
+
+# Resource types listed once per environment
+ENVIRONMENT_TYPES = ("segments", "experiments")
+
+
+##################################################
+# Bring an existing project in line with a manifest
+##################################################
+class ProjectReconciler:
+    """
+    Compares the live project with the builder's manifest and turns the
+    differences into a build graph. Every resource type is listed once,
+    concurrently, and the flags and segments the manifest keeps are read in
+    full. Missing resources get the builder's own create steps. Drifted
+    names, descriptions and tags, flag variations, prerequisites, targeting
+    rules and fallthroughs, and segment rules are JSON patched. Attached
+    metrics and rollouts are put back with the builder's own calls. With
+    prune=True resources the manifest no longer has are deleted.
+    Experiments are only ever created or renamed, so their history survives
+    a re-deploy.
+    """
+
+    def __init__(self, builder, prune=True):
+        self.builder = builder
+        self.platform = builder.ldproject
+        self.manifest = builder.manifest
+        self.prune = prune
+        # (action, description) of every change in the plan
+        self.changes = []
+        # Full reads of the live flags and segments, see load_details
+        self.flags = {}
+        self.segments = {}
+        self.flag_metrics = {}
+
+    ##################################################
+    # Live state
+    ##################################################
+    def environments(self):
+        return self.manifest.environments() or ["production"]
+
+    def scopes(self):
+        envs = self.environments()
+        scopes = []
+        for resource_type in LDInventory.RESOURCE_TYPES:
+            if resource_type in ENVIRONMENT_TYPES:
+                scopes += [(resource_type, env_key) for env_key in envs]
+            else:
+                scopes.append((resource_type, None))
+        return scopes
+
+    def load(self):
+        self.platform.project_key = self.builder.project_key
+        self.platform.use_inventory()
+        self.platform.inventory.preload(self.scopes(), max_workers=self.builder.max_workers)
+        self.load_details()
+
+    def load_details(self):
+        """Read the flags and segments the manifest keeps, and the metrics attached to its flags."""
+        inventory = self.platform.inventory
+        max_workers = self.builder.max_workers
+        flags = [flag["key"] for flag in self.manifest.flags if flag["key"] in self.live("flags")]
+        self.flags = inventory.details("flags", flags, max_workers=max_workers)
+        for item in self.flags.values():
+            # Lookups of variation IDs by later steps need no read of their own
+            self.platform.flag_catalog.seed(item)
+        for env_key in self.environments():
+            segments = [
+                segment["key"] for segment in self.manifest.segments
+                if segment["environment"] == env_key and segment["key"] in self.live("segments", env_key)
+            ]
+            self.segments[env_key] = inventory.details("segments", segments, env_key, max_workers=max_workers)
+
+        measured = [flag["key"] for flag in self.manifest.flags if flag.get("metrics") and flag["key"] in self.flags]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            metrics = list(executor.map(LDScheduler.in_current_task(self.platform.get_flag_metrics), measured))
+        for key, keys in zip(measured, metrics):
+            if keys is None:
+                raise RuntimeError(f"Unable to read the metrics attached to flag {key}")
+            self.flag_metrics[key] = keys
+
+    def live(self, resource_type, env_key=None):
+        return self.platform.inventory.index(resource_type, env_key)
+
+    ##################################################
+    # Plan
+    ##################################################
+    def plan(self):
+        """Return the graph of steps that bring the project in line with the manifest."""
+        manifest = self.manifest
+        graph = self.builder.build_graph(project=self.builder.attach_project)
+        keep = {"project"}
+        created_flags = set()
+
+        def create(node, description):
+            keep.add(node)
+            self.changes.append(("create", description))
+
+        for segment in manifest.segments:
+            live = self.live("segments", segment["environment"]).get(segment["key"])
+            if live is None:
+                create("segment:" + segment["key"], "segment " + segment["key"])
+            else:
+                live = self.segments.get(segment["environment"], {}).get(segment["key"], live)
+                self.update(graph, keep, "segments", segment, live, segment["environment"], *self.segment_patch(segment, live))
+
+        for metric in manifest.metrics:
+            live = self.live("metrics").get(metric["key"])
+            if live is None:
+                create("metric:" + metric["key"], "metric " + metric["key"])
+            else:
+                self.update(graph, keep, "metrics", metric, live)
+
+        for group in manifest.metric_groups:
+            live = self.live("metric-groups").get(group["key"])
+            if live is None:
+                create("metric-group:" + group["key"], "metric group " + group["key"])
+            else:
+                self.update(graph, keep, "metric-groups", group, live)
+
+        for flag in manifest.flags:
+            live = self.live("flags").get(flag["key"])
+            if live is None:
+                create("flag:" + flag["key"], "flag " + flag["key"])
+                created_flags.add(flag["key"])
+            else:
+                live = self.flags.get(flag["key"], live)
+                patch, changed, deps = self.flag_patch(flag, live)
+                node = self.update(graph, keep, "flags", flag, live, None, patch, changed, deps)
+                self.plan_flag_measurement(graph, keep, flag, live, node)
+
+        for config in manifest.ai_configs:
+            live = self.live("ai-configs").get(config["key"])
+            if live is None:
+                create("ai-config:" + config["key"], "AI config " + config["key"])
+                created_flags.add(config["key"])
+            elif live.get("variations") is not None:
+                # The list only says which variations exist, so new ones are
+                # added and existing ones left as they are
+                existing = {variation.get("key") for variation in live["variations"]}
+                for variation in config.get("variations", []):
+                    if variation["key"] not in existing:
+                        node = graph.add(
+                            "ai-config-variation:" + config["key"] + ":" + variation["key"],
+                            functools.partial(
+                                self.builder.run_checked,
+                                "creating AI config variation " + config["key"] + "/" + variation["key"],
+                                self.platform.create_ai_config_versions,
+                                config["key"],
+                                variation["key"],
+                                variation["model_config_key"],
+                                variation["name"],
+                                variation["model"],
+                                variation["messages"],
+                                variation.get("custom"),
+                                allowed=(409,),
+                            ),
+                            ["project"],
+                            phase="ai-config",
+                        )
+                        create(node, "AI config variation " + config["key"] + "/" + variation["key"])
+
+        for key in manifest.client_side_availability:
+            if key in created_flags:
+                keep.add("client-side:" + key)
+
+        for experiment in manifest.experiments:
+            live = self.live("experiments", experiment["environment"]).get(experiment["key"])
+            if live is None:
+                create("experiment:" + experiment["key"], "experiment " + experiment["key"])
+            elif live.get("name") != experiment["name"]:
+                node = graph.add(
+                    "update:experiments:" + experiment["key"],
+                    functools.partial(
+                        self.builder.run_checked,
+                        "renaming experiment " + experiment["key"],
+                        self.platform.update_resource,
+                        "experiments",
+                        experiment["key"],
+                        {"name": experiment["name"]},
+                        experiment["environment"],
+                    ),
+                    ["project"],
+                    phase="update",
+                )
+                keep.add(node)
+                self.changes.append(("update", "experiment " + experiment["key"] + " (name)"))
+
+        self.plan_settings(graph, keep, created_flags)
+        self.plan_release_pipeline(graph, keep, created_flags)
+        self.plan_results(graph, keep)
+        if self.prune:
+            self.plan_deletes(graph, keep)
+        return graph.select(keep)
+
+    def plan_settings(self, graph, keep, created_flags):
+        manifest = self.manifest
+        # New flags get their toggles and targeting from the settings step.
+        # The targeting rules of existing flags are patched with the rest of
+        # the flag (see flag_patch), their on/off state here
+        settings_flags = {
+            entry["flag"] for entry in manifest.toggles + manifest.targeting
+        } & created_flags
+        if settings_flags:
+            keep.add("settings")
+            graph.tasks["settings"].fn = functools.partial(self.builder.project_settings, flags=settings_flags)
+            self.changes.append(("update", "settings of " + ", ".join(sorted(settings_flags))))
+
+        for toggle in manifest.toggles:
+            if toggle["flag"] in created_flags:
+                continue
+            live = self.live("flags").get(toggle["flag"])
+            environment = ((live or {}).get("environments") or {}).get(toggle["environment"])
+            if environment is None or "on" not in environment:
+                continue
+            state = toggle.get("enabled", True)
+            if environment["on"] == state:
+                continue
+            # Experiments created in this run turn their flag on themselves
+            experiments = [
+                "experiment:" + experiment["key"]
+                for experiment in manifest.experiments
+                if experiment["flag"] == toggle["flag"] and "experiment:" + experiment["key"] in keep
+            ]
+            node = graph.add(
+                "toggle:" + toggle["flag"] + ":" + toggle["environment"],
+                functools.partial(
+                    self.builder.run_checked,
+                    "toggling flag " + toggle["flag"],
+                    self.platform.toggle_flag,
+                    toggle["flag"],
+                    "on" if state else "off",
+                    toggle["environment"],
+                    toggle.get("comment", ""),
+                ),
+                ["project"] + experiments,
+                phase="settings",
+            )
+            keep.add(node)
+            self.changes.append(("update", f"flag {toggle['flag']} {'on' if state else 'off'} in {toggle['environment']}"))
+
+    def plan_release_pipeline(self, graph, keep, created_flags):
+        pipeline = self.manifest.release_pipeline
+        if not pipeline:
+            return
+        if pipeline["key"] not in self.live("release-pipelines"):
+            keep.add("release-pipeline")
+            self.changes.append(("create", "release pipeline " + pipeline["key"]))
+            enrolled = [entry["flag"] for entry in pipeline.get("flags", [])]
+        else:
+            # Flags already in the pipeline keep the phase they have reached
+            enrolled = [entry["flag"] for entry in pipeline.get("flags", []) if entry["flag"] in created_flags]
+        if enrolled:
+            # Also looks up the phase IDs of an existing pipeline
+            keep.add("release-pipeline")
+            keep.update(["pipeline-flags", "pipeline-phases"])
+            graph.tasks["pipeline-flags"].fn = functools.partial(self.builder.enroll_pipeline_flags, flags=set(enrolled))
+            graph.tasks["pipeline-phases"].fn = functools.partial(self.builder.advance_pipeline_flags, flags=set(enrolled))
+
+    def plan_results(self, graph, keep):
+        # Results are generated on every run. Toggles and flag updates added
+        # here are not in the build graph, so the scenarios that send traffic
+        # to those flags are made to wait for them too
+        for name, task in graph.tasks.items():
+            if not name.startswith("results:"):
+                continue
+            keep.add(name)
+            flag = LDResultsGenerator.SCENARIOS.get(task.spec)
+            changes = []
+            for node in sorted(keep):
+                parts = node.split(":")
+                if parts[0] in ("toggle", "rollout", "flag-metrics"):
+                    changed = parts[1]
+                elif parts[:2] == ["update", "flags"]:
+                    changed = parts[2]
+                else:
+                    continue
+                if flag is None or changed == flag:
+                    changes.append(node)
+            task.deps += tuple(changes)
+
+    def plan_deletes(self, graph, keep):
+        manifest = self.manifest
+        desired = {
+            "metric-groups": manifest.metric_group_keys(),
+            "metrics": manifest.metric_keys(),
+            "segments": manifest.segment_keys(),
+            "ai-configs": manifest.ai_config_keys(),
+            "flags": manifest.flag_keys(),
+            "release-pipelines": {manifest.release_pipeline["key"]} if manifest.release_pipeline else set(),
+        }
+        # Flags created by AI configs go with their config, and flags and
+        # metrics of the experiments that are kept stay
+        protected = {"flags": set(self.live("ai-configs")), "metrics": set()}
+        for env_key in self.environments():
+            for experiment in self.live("experiments", env_key).values():
+                iteration = experiment.get("currentIteration") or {}
+                protected["flags"].update(iteration.get("flags") or {})
+                protected["metrics"].update(metric.get("key") for metric in iteration.get("metrics") or [])
+
+        previous = []
+        for resource_type in PRUNED_TYPES:
+            env_keys = self.environments() if resource_type in ENVIRONMENT_TYPES else [None]
+            nodes = []
+            for env_key in env_keys:
+                for key in self.live(resource_type, env_key):
+                    if key in desired[resource_type] or key in protected.get(resource_type, ()):
+                        continue
+                    name = "delete:" + resource_type + ":" + key + (":" + env_key if env_key else "")
+                    # Metric groups go before the metrics in them
+                    graph.add(
+                        name,
+                        functools.partial(
+                            self.builder.run_checked,
+                            "deleting " + resource_type.rstrip("s").replace("-", " ") + " " + key,
+                            self.platform.delete_resource,
+                            resource_type,
+                            key,
+                            env_key,
+                            allowed=(404,),
+                        ),
+                        ["project"] + previous,
+                        phase="delete",
+                    )
+                    nodes.append(name)
+                    self.changes.append(("delete", resource_type.rstrip("s").replace("-", " ") + " " + key))
+            keep.update(nodes)
+            if resource_type == "metric-groups":
+                previous = nodes
+
+    def update(self, graph, keep, resource_type, spec, live, env_key=None, patch=(), changed=(), deps=()):
+        """
+        Add a step that JSON patches the fields of an existing resource that
+        differ from spec, together with patch, the operations for changed.
+        deps are the steps creating what patch refers to. Returns the step,
+        or None when nothing differs.
+        """
+        fields = {}
+        for field, value in self.desired_fields(resource_type, spec).items():
+            current = live.get(field, "" if field == "description" else None)
+            if field == "tags":
+                if sorted(current or []) != sorted(value):
+                    fields[field] = value
+            elif current is not None and current != value:
+                fields[field] = value
+        operations = [{"op": "replace", "path": "/" + field, "value": value} for field, value in fields.items()]
+        operations += patch
+        if not operations:
+            return None
+        name = graph.add(
+            "update:" + resource_type + ":" + spec["key"] + (":" + env_key if env_key else ""),
+            functools.partial(
+                self.builder.run_checked,
+                "updating " + resource_type.rstrip("s").replace("-", " ") + " " + spec["key"],
+                self.platform.patch_resource,
+                resource_type,
+                spec["key"],
+                operations,
+                env_key,
+            ),
+            ["project"] + list(deps),
+            phase="update",
+        )
+        keep.add(name)
+        self.changes.append(("update", f"{resource_type.rstrip('s').replace('-', ' ')} {spec['key']} ({', '.join(sorted(fields) + list(changed))})"))
+        return name
+
+    ##################################################
+    # Configuration of existing flags and segments
+    ##################################################
+    def segment_patch(self, spec, live):
+        """(JSON patch, changed) replacing a segment's rules when they differ from spec's."""
+        desired = [
+            LDPlatform.LDPlatform.segment_rule(rule["context_kind"], rule["attribute"], rule["op"], rule["values"])
+            for rule in spec.get("rules", [])
+        ]
+        if "rules" not in live:
+            return [], []
+        # A segment matches on any of its rules, so their order is not compared
+        if sorted(map(rule_signature, live["rules"])) == sorted(map(rule_signature, desired)):
+            return [], []
+        return [{"op": "replace", "path": "/rules", "value": desired}], ["rules"]
+
+    def flag_patch(self, spec, live):
+        """
+        (JSON patch, changed, deps) bringing an existing flag's variations,
+        defaults, prerequisites, targeting rules and fallthrough in line
+        with spec, in every environment the manifest configures.
+        """
+        manifest = self.manifest
+        patch = []
+        changed = []
+        deps = []
+
+        variations = live.get("variations")
+        if variations is not None:
+            operations = []
+            for index, variation in enumerate(spec["variations"]):
+                if index >= len(variations):
+                    operations.append({"op": "add", "path": "/variations/-", "value": variation})
+                    continue
+                for field in ("value", "name", "description"):
+                    if field in variation and variations[index].get(field) != variation[field]:
+                        operations.append({"op": "replace", "path": f"/variations/{index}/{field}", "value": variation[field]})
+            # Highest index first, so each removal leaves the next one's index alone
+            for index in reversed(range(len(spec["variations"]), len(variations))):
+                operations.append({"op": "remove", "path": f"/variations/{index}"})
+            if operations:
+                patch += operations
+                changed.append("variations")
+
+        defaults = {"onVariation": spec.get("on_variation", 0), "offVariation": spec.get("off_variation", 1)}
+        if live.get("defaults") is not None and live["defaults"] != defaults:
+            patch.append({"op": "replace", "path": "/defaults", "value": defaults})
+            changed.append("defaults")
+
+        prerequisites = [{"key": prereq["flag"], "variation": prereq.get("variation", 0)} for prereq in spec.get("prerequisites", [])]
+        deps += ["flag:" + prereq["key"] for prereq in prerequisites]
+        # Targeting rules serve the first variation not named "disabled", as
+        # add_segment_to_flag does
+        served = next((index for index, variation in enumerate(spec["variations"]) if variation.get("name") != "disabled"), 0)
+        # Experiments and the release pipeline manage the fallthrough of
+        # their flags
+        managed = spec["key"] in manifest.pipeline_flag_keys() or any(
+            experiment["flag"] == spec["key"] for experiment in manifest.experiments
+        )
+
+        for env_key in self.environments():
+            environment = (live.get("environments") or {}).get(env_key)
+            if environment is None:
+                continue
+            path = "/environments/" + env_key
+
+            if "prerequisites" in environment:
+                current = [{"key": prereq.get("key"), "variation": prereq.get("variation")} for prereq in environment["prerequisites"]]
+                if sorted(current, key=lambda prereq: prereq["key"]) != sorted(prerequisites, key=lambda prereq: prereq["key"]):
+                    patch.append({"op": "replace", "path": path + "/prerequisites", "value": prerequisites})
+                    changed.append("prerequisites in " + env_key)
+
+            segments = [target["segment"] for target in manifest.targeting if target["flag"] == spec["key"] and target["environment"] == env_key]
+            rules = [
+                {
+                    "variation": served,
+                    "clauses": [{
+                        "contextKind": "",
+                        "attribute": "segmentMatch",
+                        "op": "segmentMatch",
+                        "negate": False,
+                        "values": [segment],
+                    }],
+                }
+                for segment in segments
+            ]
+            if "rules" in environment:
+                # Flag rules are evaluated in order, so it is compared
+                current = [(rule.get("variation"), rule_signature(rule)) for rule in environment["rules"]]
+                if current != [(rule["variation"], rule_signature(rule)) for rule in rules]:
+                    patch.append({"op": "replace", "path": path + "/rules", "value": rules})
+                    changed.append("targeting in " + env_key)
+                    deps += ["segment:" + segment for segment in segments]
+
+            rollout = spec.get("rollout")
+            fallthrough = environment.get("fallthrough") or {}
+            if not managed and "rollout" in fallthrough and not (rollout and rollout["environment"] == env_key):
+                patch.append({"op": "replace", "path": path + "/fallthrough", "value": {"variation": spec.get("on_variation", 0)}})
+                changed.append("fallthrough in " + env_key)
+
+        return patch, changed, deps
+
+    def plan_flag_measurement(self, graph, keep, spec, live, update):
+        """Add steps putting back an existing flag's attached metrics and its rollout."""
+        key = spec["key"]
+        metric_steps = [
+            ("metric-group:" if self.manifest.is_metric_group(metric) else "metric:") + metric
+            for metric in spec.get("metrics", []) + self.manifest.rollout_metrics(spec)
+        ]
+        deps = ["project"] + ([update] if update else [])
+
+        if spec.get("metrics") and sorted(self.flag_metrics.get(key, [])) != sorted(spec["metrics"]):
+            node = graph.add(
+                "flag-metrics:" + key,
+                functools.partial(self.builder.run_checked, "attaching metrics to flag " + key, self.platform.attach_metric_to_flag, key, spec["metrics"]),
+                deps + metric_steps,
+                phase="update",
+            )
+            keep.add(node)
+            deps.append(node)
+            self.changes.append(("update", f"flag {key} (attached metrics)"))
+
+        rollout = spec.get("rollout")
+        if not rollout:
+            return
+        environment = (live.get("environments") or {}).get(rollout["environment"])
+        # A rollout that finished, rolled back or was stopped leaves a fixed
+        # fallthrough behind, and the demo starts it again
+        if environment is None or "rollout" in (environment.get("fallthrough") or {}):
+            return
+        node = graph.add(
+            "rollout:" + key,
+            functools.partial(self.builder.run_checked, "adding the rollout of flag " + key, self.builder.add_rollout, spec),
+            deps + metric_steps,
+            phase="update",
+        )
+        keep.add(node)
+        self.changes.append(("update", f"flag {key} ({rollout['type']} rollout in {rollout['environment']})"))
+
+    @staticmethod
+    def desired_fields(resource_type, spec):
+        fields = {"name": spec["name"], "description": spec.get("description", "")}
+        if "tags" in spec:
+            fields["tags"] = spec["tags"]
+        if resource_type == "flags":
+            fields["temporary"] = spec.get("temporary", False)
+        return {
+            field: value
+            for field, value in fields.items()
+            if field in LDPlatform.RECONCILE_FIELDS.get(resource_type, [])
+        }
+
+    ##################################################
+    # Reporting
+    ##################################################
+    def print_changes(self):
+        if not self.changes:
+            print("Project matches the manifest")
+            return
+        counts = {}
+        for action, description in self.changes:
+            counts[action] = counts.get(action, 0) + 1
+            print(f"  {action}: {description}")
+        print(", ".join(f"{count} to {action}" for action, count in counts.items()))
+
+
+def rule_signature(rule):
+    """What a flag or segment rule matches on, without its IDs and the defaults the API fills in."""
+    return tuple(
+        (
+            # Segment matches apply whatever the context kind
+            "" if clause.get("op") == "segmentMatch" else clause.get("contextKind") or "",
+            clause.get("attribute"),
+            clause.get("op"),
+            tuple(clause.get("values") or []),
+            bool(clause.get("negate")),
+        )
+        for clause in rule.get("clauses") or []
+    )
@@ -0,0 +1,192 @@
+import heapq
+import itertools
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import LDScheduler
+
+# Phases of the ToggleStore release pipeline, in the order a flag goes
+# through them
+PHASE_ORDER = ("test", "guard", "ga")
+
+# Phase and audience statuses that mean a phase has been started
+STARTED_STATUSES = {"active", "started", "complete", "completed"}
+
+
+def phase_started(release, phase_id):
+    """
+    True once the flag's release reports phase_id as started or complete.
+    None when the release does not say, in which case the next phase's PUT
+    is left to the retry policy.
+    """
+    for phase in release.get("phases") or []:
+        if phase.get("_id", phase.get("id")) != phase_id:
+            continue
+        if phase.get("complete") or phase.get("started"):
+            return True
+        statuses = [phase.get("status")] + [audience.get("status") for audience in phase.get("_audiences") or []]
+        statuses = [status for status in statuses if status]
+        if not statuses:
+            return None
+        return any(status in STARTED_STATUSES for status in statuses)
+    return None
+
+
+##################################################
+# Where one flag is in the pipeline
+##################################################
+class FlagRelease:
+    """
+    inspect -> advance -> settle -> advance ... -> done, or failed. inspect
+    skips the phases the flag has already reached, advance starts the next
+    phase and settle polls until the release reports it as started.
+    """
+
+    def __init__(self, flag_key, phases):
+        self.flag_key = flag_key
+        # Target phases in pipeline order, whatever order they were listed in
+        self.phases = sorted(phases, key=PHASE_ORDER.index)
+        self.index = 0
+        self.state = "inspect"
+        self.delay = 0.0
+        self.settle_started = None
+        self.polls = 0
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def phase(self):
+        return self.phases[self.index] if self.index < len(self.phases) else None
+
+    @property
+    def duration(self):
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+
+##################################################
+# Advance many flags through a pipeline at once
+##################################################
+class PipelineAdvancer:
+    """
+    Moves each flag through its release phases, one phase after another,
+    with every flag's next request sent as soon as it is due. Requests run
+    on a small worker pool and waiting flags hold no thread: a flag whose
+    phase has not settled yet is polled again after a short delay that
+    grows from min_delay to max_delay, instead of sleeping a fixed time.
+    """
+
+    def __init__(self, platform, phase_ids, max_workers=LDScheduler.DEFAULT_MAX_WORKERS, min_delay=0.25, max_delay=2.0, timeout=60.0):
+        self.platform = platform
+        self.phase_ids = phase_ids
+        self.max_workers = max_workers
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.task = None
+
+    def run(self, entries, inspect=True):
+        """
+        Advance the flags of entries ({flag, phases}). With inspect=False
+        the flags are taken to be in no phase yet, as when just enrolled.
+        Returns {flag key: FlagRelease}.
+        """
+        releases = {
+            entry["flag"]: FlagRelease(entry["flag"], entry.get("phases", []))
+            for entry in entries
+            if entry.get("phases")
+        }
+        if not inspect:
+            for release in releases.values():
+                release.state = "advance"
+        # Requests are attributed to the build step running the advancer
+        self.task = LDScheduler.current_task()
+        order = itertools.count()
+        due = [(time.time(), next(order), release) for release in releases.values()]
+        heapq.heapify(due)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ldrelease") as executor:
+            while due or running:
+                now = time.time()
+                while due and due[0][0] <= now and len(running) < self.max_workers:
+                    _, _, release = heapq.heappop(due)
+                    running[executor.submit(self.step, release)] = release
+                timeout = max(due[0][0] - now, 0) if due else None
+                if not running:
+                    time.sleep(timeout)
+                    continue
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    release = running.pop(future)
+                    delay = future.result()
+                    if delay is not None:
+                        heapq.heappush(due, (time.time() + delay, next(order), release))
+        return releases
+
+    def step(self, release):
+        """Take release's next action. Returns seconds until the one after, or None when finished."""
+        LDScheduler.context.task = self.task
+        try:
+            if release.started_at is None:
+                release.started_at = time.time()
+            getattr(self, release.state)(release)
+        except Exception as e:
+            release.error = str(e)
+            release.state = "failed"
+        finally:
+            LDScheduler.context.task = None
+        if release.state in ("done", "failed"):
+            release.finished_at = time.time()
+            return None
+        return release.delay if release.state == "settle" else 0.0
+
+    ##################################################
+    # States
+    ##################################################
+    def inspect(self, release):
+        # Phases the flag has reached already, e.g. on a resumed build
+        data = self.release(release.flag_key)
+        while release.phase is not None and data and phase_started(data, self.phase_ids[release.phase]):
+            release.index += 1
+        release.state = "advance" if release.phase is not None else "done"
+
+    def advance(self, release):
+        res = self.platform.advance_flag_phase(release.flag_key, "active", self.phase_ids[release.phase])
+        if res.status_code != 200:
+            release.error = f"{release.phase}: HTTP {res.status_code}"
+            release.state = "failed"
+            return
+        if release.index == len(release.phases) - 1:
+            # Nothing waits for the last phase to settle
+            release.index += 1
+            release.state = "done"
+            return
+        release.state = "settle"
+        release.delay = self.min_delay
+        release.settle_started = time.time()
+
+    def settle(self, release):
+        release.polls += 1
+        data = self.release(release.flag_key)
+        started = phase_started(data, self.phase_ids[release.phase]) if data else None
+        if started is False:
+            if time.time() - release.settle_started > self.timeout:
+                release.error = f"{release.phase}: not started after {self.timeout:.0f}s"
+                release.state = "failed"
+            else:
+                release.delay = min(release.delay * 2, self.max_delay)
+            return
+        release.index += 1
+        release.state = "advance" if release.phase is not None else "done"
+
+    def release(self, flag_key):
+        res = self.platform.get_flag_release(flag_key)
+        if res.status_code != 200:
+            return None
+        try:
+            return json.loads(res.text)
+        except json.JSONDecodeError:
+            return None
@@ -0,0 +1,206 @@
+import json
+import os
+import threading
+import time
+
+DEFAULT_REPORT = "ld-build-report.json"
+
+# Phase of requests sent outside any build step, e.g. the member lookup
+SETUP_PHASE = "(setup)"
+
+
+##################################################
+# Requests of one phase
+##################################################
+class PhaseStats:
+    def __init__(self, phase):
+        self.phase = phase
+        # "VERB /route" -> number of requests
+        self.routes = {}
+        self.calls = 0
+        self.errors = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.rate_limit_wait = 0.0
+        self.retry_wait = 0.0
+        self.retries = 0
+        # Requests that ended in a connection error or timeout
+        self.failed = 0
+        self.steps = 0
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def seconds(self):
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+    def span(self, started_at, finished_at):
+        self.started_at = started_at if self.started_at is None else min(self.started_at, started_at)
+        self.finished_at = finished_at if self.finished_at is None else max(self.finished_at, finished_at)
+
+    def as_dict(self):
+        return {
+            "phase": self.phase,
+            "seconds": round(self.seconds, 2),
+            "steps": self.steps,
+            "calls": self.calls,
+            "errors": self.errors,
+            "routes": dict(sorted(self.routes.items(), key=lambda item: -item[1])),
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "rate_limit_wait": round(self.rate_limit_wait, 2),
+            "retry_wait": round(self.retry_wait, 2),
+            "retries": self.retries,
+            "failed": self.failed,
+        }
+
+
+##################################################
+# Timing and API call accounting of a build
+##################################################
+class BuildReport:
+    """
+    Every request the platform sends, counted against the phase of the
+    build step that sent it, with the phases' wall-clock times from the
+    build graph. Safe to record into from the build's worker threads.
+    """
+
+    def __init__(self, project_key):
+        self.project_key = project_key
+        self.mode = None
+        self.completed = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.phases = {}
+        self.lock = threading.Lock()
+
+    def stats(self, phase):
+        phase = phase or SETUP_PHASE
+        if phase not in self.phases:
+            self.phases[phase] = PhaseStats(phase)
+        return self.phases[phase]
+
+    def record(self, phase, route, status_code, body, response, rate_limit_wait, retry_wait, retries):
+        """
+        Count one request, after its last attempt. body is the JSON payload
+        sent, if any. status_code and response are None when the request
+        ended in a connection error or timeout.
+        """
+        bytes_out = len(json.dumps(body).encode()) if body is not None else 0
+        bytes_in = len(getattr(response, "content", b"") or b"") if response is not None else 0
+        with self.lock:
+            stats = self.stats(phase)
+            stats.routes[route] = stats.routes.get(route, 0) + 1
+            stats.calls += 1
+            if status_code is None:
+                stats.failed += 1
+            elif status_code >= 400:
+                stats.errors += 1
+            stats.bytes_out += bytes_out
+            stats.bytes_in += bytes_in
+            stats.rate_limit_wait += rate_limit_wait
+            stats.retry_wait += retry_wait
+            stats.retries += retries
+
+    def add_graph(self, graph):
+        """Take the steps and wall-clock time of each phase from a graph that has run."""
+        with self.lock:
+            for task in graph.tasks.values():
+                if task.started_at is None:
+                    continue
+                stats = self.stats(task.phase)
+                stats.steps += 1
+                stats.span(task.started_at, task.finished_at)
+
+    def add_span(self, phase, started_at, finished_at):
+        """Extend phase's wall-clock time, for work that outlives its build steps."""
+        with self.lock:
+            self.stats(phase).span(started_at, finished_at)
+
+    def finish(self, mode, completed):
+        self.mode = mode
+        self.completed = completed
+        self.finished_at = time.time()
+
+    ##################################################
+    # Output
+    ##################################################
+    def results(self):
+        with self.lock:
+            # Phases in the order they started, setup first
+            phases = sorted(
+                self.phases.values(),
+                key=lambda stats: (stats.phase != SETUP_PHASE, stats.started_at or 0.0),
+            )
+            phases = [stats.as_dict() for stats in phases]
+        return {
+            "project": self.project_key,
+            "mode": self.mode,
+            "completed": self.completed,
+            "seconds": round((self.finished_at or time.time()) - self.started_at, 2),
+            "calls": sum(phase["calls"] for phase in phases),
+            "errors": sum(phase["errors"] for phase in phases),
+            "bytes_out": sum(phase["bytes_out"] for phase in phases),
+            "bytes_in": sum(phase["bytes_in"] for phase in phases),
+            "rate_limit_wait": round(sum(phase["rate_limit_wait"] for phase in phases), 2),
+            "retry_wait": round(sum(phase["retry_wait"] for phase in phases), 2),
+            "retries": sum(phase["retries"] for phase in phases),
+            "failed": sum(phase["failed"] for phase in phases),
+            "phases": phases,
+        }
+
+    def markdown(self, top_routes=10):
+        results = self.results()
+        lines = [
+            f"### LaunchDarkly {results['mode'] or 'build'} of `{results['project']}`",
+            "",
+            f"{results['seconds']:.1f}s, {results['calls']} API calls ({results['errors']} errors, "
+            f"{results['failed']} connection failures, {results['retries']} retries), "
+            f"{results['rate_limit_wait']:.1f}s waiting on rate limits, {results['retry_wait']:.1f}s backing off, "
+            f"{format_bytes(results['bytes_out'])} sent, {format_bytes(results['bytes_in'])} received",
+            "",
+            "| Phase | Time | Steps | Calls | Sent | Received | Rate limit wait | Retries | Retry wait |",
+            "| --- | ---: | ---: | ---: | ---: | ---: | ---: | ---: | ---: |",
+        ]
+        for phase in results["phases"]:
+            lines.append(
+                f"| {phase['phase']} | {phase['seconds']:.1f}s | {phase['steps']} | {phase['calls']} | "
+                f"{format_bytes(phase['bytes_out'])} | {format_bytes(phase['bytes_in'])} | "
+                f"{phase['rate_limit_wait']:.1f}s | {phase['retries']} | {phase['retry_wait']:.1f}s |"
+            )
+        routes = {}
+        for phase in results["phases"]:
+            for route, count in phase["routes"].items():
+                routes[route] = routes.get(route, 0) + count
+        if routes:
+            lines += ["", "| Route | Calls |", "| --- | ---: |"]
+            for route, count in sorted(routes.items(), key=lambda item: -item[1])[:top_routes]:
+                lines.append(f"| `{route}` | {count} |")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=DEFAULT_REPORT):
+        try:
+            with open(path, "w") as f:
+                json.dump(self.results(), f, indent=2)
+        except IOError as e:
+            print(f"Unable to write build report: {e}")
+
+    def write_step_summary(self):
+        path = os.getenv("GITHUB_STEP_SUMMARY")
+        if not path:
+            return
+        try:
+            with open(path, "a") as f:
+                f.write(self.markdown())
+        except IOError as e:
+            print(f"Unable to write step summary: {e}")
+
+
+def format_bytes(count):
+    for unit in ("B", "KB"):
+        if count < 1024:
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} MB"
@@ -1,3 +1,4 @@
+import argparse
 import os
 import logging
 import requests
@@ -11,18 +12,13 @@ import time
 import threading
 from datetime import datetime, timedelta
 
+import LDScheduler
+
 load_dotenv()
 
-LD_API_KEY = os.getenv("LD_API_KEY")
-PROJECT_KEY = os.getenv("LD_PROJECT_KEY")
 LD_API_URL = os.getenv("LD_API_URL", "https://app.launchdarkly.com/api/v2")
 ENVIRONMENT_KEY = "production"
 
-HEADERS = {
-    "Authorization": LD_API_KEY,
-    "Content-Type": "application/json"
-}
-
 # Flag keys
 PAYMENTS_FLAG_KEY = "paymentsSystemsUpgrade"
 DATABASE_FLAG_KEY = "databaseUpgrade"
@@ -56,18 +52,117 @@ AI_RELEVANCE_KEY = "ai-relevance"
 AI_COST_KEY = "ai-cost"
 AI_CHATBOT_NEGATIVE_FEEDBACK_KEY = "ai-chatbot-negative-feedback"
 
+# Traffic scenarios in the order a full run goes through them, with the flag
+# whose experiment or guarded rollout each one produces results for.
+# "evaluations" evaluates every togglestore flag
+SCENARIOS = {
+    "evaluations": None,
+    "search-algorithm": SEARCH_ALGORITHM_FLAG_KEY,
+    "store-promo-banner": STORE_PROMO_FLAG_KEY,
+    "ai-config": AI_CONFIG_FLAG_KEY,
+    "payments-upgrade": PAYMENTS_FLAG_KEY,
+    "database-upgrade": DATABASE_FLAG_KEY,
+}
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s %(levelname)s %(message)s'
 )
 
-def get_flag_details(flag_key):
-    url = f"{LD_API_URL}/flags/{PROJECT_KEY}/{flag_key}"
-    response = requests.get(url, headers=HEADERS)
-    if not response.ok:
-        logging.error(f"Failed to fetch flag details: {response.status_code} {response.text}")
-        return None
-    return response.json()
+##################################################
+# REST reads of the scenarios
+##################################################
+class RestAPI:
+    """
+    Reads flags with a session of its own, for the standalone generator.
+    Keeps the last seen (ETag, parsed body) per flag, so the rollout
+    polling loops send conditional GETs and skip unchanged documents.
+    """
+
+    def __init__(self, project_key, api_key):
+        self.project_key = project_key
+        self.headers = {
+            "Authorization": api_key,
+            "Content-Type": "application/json"
+        }
+        self.session = requests.Session()
+        self.flag_details = {}
+
+    def get_flag(self, flag_key):
+        url = f"{LD_API_URL}/flags/{self.project_key}/{flag_key}"
+        headers = dict(self.headers)
+        cached = self.flag_details.get(flag_key)
+        if cached is not None:
+            headers["If-None-Match"] = cached[0]
+
+        response = self.session.get(url, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            return cached[1]
+        if not response.ok:
+            logging.error(f"Failed to fetch flag details: {response.status_code} {response.text}")
+            return None
+
+        data = response.json()
+        etag = response.headers.get("ETag")
+        if etag:
+            self.flag_details[flag_key] = (etag, data)
+        return data
+
+    def list_flags(self):
+        url = f"{LD_API_URL}/flags/{self.project_key}?limit=100"
+        response = self.session.get(url, headers=self.headers)
+        if not response.ok:
+            logging.error(f"Failed to fetch flags: {response.status_code} {response.text}")
+            return None
+        return response.json().get('items', [])
+
+
+class PlatformAPI:
+    """
+    Reads flags through a builder's LDPlatform, sharing its session and
+    rate limiter, and its flag inventory where the build has loaded it.
+    Flag documents are always read fresh, as the polling loops act on the
+    rollout state they hold, and keep the builder's flag catalog current.
+    """
+
+    def __init__(self, platform):
+        self.platform = platform
+        # Reads from the rollout threads count towards the build step that
+        # created the API
+        self.get_flag = LDScheduler.in_current_task(self.get_flag)
+        self.list_flags = LDScheduler.in_current_task(self.list_flags)
+
+    def get_flag(self, flag_key):
+        res = self.platform.getrequest(
+            "GET",
+            f"{LD_API_URL}/flags/{self.platform.project_key}/{flag_key}",
+            headers={"Authorization": self.platform.api_key},
+            cache=False,
+        )
+        if res.status_code != 200:
+            logging.error(f"Failed to fetch flag details: {res.status_code} {res.text}")
+            return None
+        data = res.json()
+        self.platform.flag_catalog.seed(data)
+        return data
+
+    def list_flags(self):
+        inventory = self.platform.inventory
+        if inventory is not None:
+            # Flags created by the build are listed with their tags, flags
+            # only known from a create conflict are not
+            flags = list(inventory.index("flags").values())
+            if all("tags" in flag for flag in flags):
+                return flags
+        res = self.platform.getrequest(
+            "GET",
+            f"{LD_API_URL}/flags/{self.platform.project_key}?limit=100",
+            headers={"Authorization": self.platform.api_key},
+        )
+        if res.status_code != 200:
+            logging.error(f"Failed to fetch flags: {res.status_code} {res.text}")
+            return None
+        return res.json().get('items', [])
 
 def is_measured_rollout(flag_details):
     """Check if flag has an active measured rollout"""
@@ -93,18 +188,15 @@ def generate_user_context():
     builder.set("operating_system", random.choice(["windows", "macos", "ios", "android"]))
     return builder.build()
 
-def evaluate_all_flags(client):
+def evaluate_all_flags(client, api):
     """Evaluate all feature flags to generate exposure events"""
     logging.info("Starting flag evaluation for all flags...")
     
     # Get all flags with togglestore tag
-    url = f"{LD_API_URL}/flags/{PROJECT_KEY}?limit=100"
-    response = requests.get(url, headers=HEADERS)
-    if not response.ok:
-        logging.error(f"Failed to fetch flags: {response.status_code} {response.text}")
+    flags = api.list_flags()
+    if flags is None:
         return
     
-    flags = response.json().get('items', [])
     togglestore_flags = [flag['key'] for flag in flags if 'togglestore' in flag.get('tags', [])]
     
     if not togglestore_flags:
@@ -129,7 +221,7 @@ def evaluate_all_flags(client):
     time.sleep(0.5)  # Wait for flush to complete
     logging.info("Flag evaluation finished.")
 
-def payments_systems_upgrade_generator(client, stop_event):
+def payments_systems_upgrade_generator(client, stop_event, api):
     """Guarded rollout generator for payments systems upgrade - SUCCESSFUL release"""
     if not client.is_initialized():
         logging.error("LaunchDarkly client is not initialized for Payments Systems Upgrade")
@@ -145,7 +237,7 @@ def payments_systems_upgrade_generator(client, stop_event):
     
     while retry_count < max_retries and not rollout_ready:
         time.sleep(5)
-        flag_details = get_flag_details(PAYMENTS_FLAG_KEY)
+        flag_details = api.get_flag(PAYMENTS_FLAG_KEY)
         if flag_details and is_measured_rollout(flag_details):
             rollout_ready = True
             logging.info("✅ Payments Systems Upgrade rollout is ready!")
@@ -164,7 +256,7 @@ def payments_systems_upgrade_generator(client, stop_event):
     while True:
         # Check rollout status every 500 users
         if status_check_counter >= 500:
-            flag_details = get_flag_details(PAYMENTS_FLAG_KEY)
+            flag_details = api.get_flag(PAYMENTS_FLAG_KEY)
             if not flag_details or not is_measured_rollout(flag_details):
                 logging.info("Measured rollout is over. Exiting Payments Systems Upgrade generator.")
                 stop_event.set()
@@ -219,7 +311,7 @@ def payments_systems_upgrade_generator(client, stop_event):
     
     logging.info(f"Payments Systems Upgrade generator finished. Total users: {user_counter}")
 
-def database_upgrade_generator(client, stop_event):
+def database_upgrade_generator(client, stop_event, api):
     """Guarded rollout generator for database upgrade - FAILED release with rollback"""
     if not client.is_initialized():
         logging.error("LaunchDarkly client is not initialized for Database Upgrade")
@@ -235,7 +327,7 @@ def database_upgrade_generator(client, stop_event):
     
     while retry_count < max_retries and not rollout_ready:
         time.sleep(5)
-        flag_details = get_flag_details(DATABASE_FLAG_KEY)
+        flag_details = api.get_flag(DATABASE_FLAG_KEY)
         if flag_details and is_measured_rollout(flag_details):
             rollout_ready = True
             logging.info("✅ Database Upgrade rollout is ready!")
@@ -255,7 +347,7 @@ def database_upgrade_generator(client, stop_event):
     while True:
         # Check rollout status every 500 users
         if status_check_counter >= 500:
-            flag_details = get_flag_details(DATABASE_FLAG_KEY)
+            flag_details = api.get_flag(DATABASE_FLAG_KEY)
             if not flag_details or not is_measured_rollout(flag_details):
                 logging.info("Measured rollout is over. Exiting Database Upgrade generator.")
                 stop_event.set()
@@ -523,90 +615,128 @@ def ai_config_experiment_generator(client):
     client.flush()
     time.sleep(0.5)  # Wait for final flush to complete
 
-def generate_results(project_key, api_key):
-    """Main function to generate all results"""
-    logging.info(f"Generating results for project {project_key}")
-    
-    sdk_key = os.getenv("LD_SDK_KEY")
-    if not sdk_key:
-        logging.error("LD_SDK_KEY not set in environment. Skipping results generation.")
-        return
-    
+def create_client(sdk_key):
+    """An SDK client of its own for the project, rather than the ldclient singleton. None if it does not initialize."""
     # Configure SDK with larger event buffer to reduce connection pool pressure
     config = Config(
         sdk_key=sdk_key,
         events_max_pending=5000,  # Increase pending events buffer to batch more events
         flush_interval=5.0  # Flush events every 5 seconds automatically
     )
-    ldclient.set_config(config)
-    client = ldclient.get()
-    
+    client = ldclient.LDClient(config)
     if not client.is_initialized():
         logging.error("Failed to initialize LaunchDarkly client")
-        return
-    
-    try:
-        # 1. Evaluate all flags to generate exposure events
+        client.close()
+        return None
+    return client
+
+def close_client(client):
+    # Ensure all events are flushed before closing
+    logging.info("Performing final flush to ensure all events are sent...")
+    client.flush()
+    time.sleep(2)  # Wait for flush to complete
+    client.flush()  # Double flush to ensure all events are sent
+    time.sleep(1)  # Final wait
+    logging.info("Final flush completed. Closing client...")
+    client.close()
+
+def run_scenarios(client, api, scenarios=None):
+    """
+    Generate the results of scenarios (default: all of SCENARIOS) with an
+    initialized client, reading flags through api (RestAPI or PlatformAPI).
+    The client is left open, so one client can serve several calls.
+    """
+    scenarios = list(SCENARIOS) if scenarios is None else [name for name in SCENARIOS if name in scenarios]
+    
+    # 1. Evaluate all flags to generate exposure events
+    if "evaluations" in scenarios:
         logging.info("=" * 60)
         logging.info("STEP 1: Generating flag evaluations")
         logging.info("=" * 60)
-        evaluate_all_flags(client)
-        
-        # 2. Generate experiment results (run before guarded rollouts for faster completion)
+        evaluate_all_flags(client, api)
+    
+    # 2. Generate experiment results (run before guarded rollouts for faster completion)
+    experiments = [name for name in ("search-algorithm", "store-promo-banner", "ai-config") if name in scenarios]
+    if experiments:
         logging.info("=" * 60)
         logging.info("STEP 2: Generating experiment results")
         logging.info("=" * 60)
         
-        search_algorithm_experiment_generator(client)
-        store_promo_banner_experiment_generator(client)
-        ai_config_experiment_generator(client)
+        if "search-algorithm" in experiments:
+            search_algorithm_experiment_generator(client)
+        if "store-promo-banner" in experiments:
+            store_promo_banner_experiment_generator(client)
+        if "ai-config" in experiments:
+            ai_config_experiment_generator(client)
         
         logging.info("Experiment results generation completed.")
-        
-        # 3. Generate guarded rollout results
+    
+    # 3. Generate guarded rollout results
+    rollouts = {
+        name: generator
+        for name, generator in (
+            ("payments-upgrade", payments_systems_upgrade_generator),
+            ("database-upgrade", database_upgrade_generator),
+        )
+        if name in scenarios
+    }
+    if rollouts:
         logging.info("=" * 60)
         logging.info("STEP 3: Generating guarded rollout results")
         logging.info("=" * 60)
         
-        payments_stop_event = threading.Event()
-        database_stop_event = threading.Event()
-        
-        payments_thread = threading.Thread(
-            target=payments_systems_upgrade_generator,
-            args=(client, payments_stop_event)
-        )
-        database_thread = threading.Thread(
-            target=database_upgrade_generator,
-            args=(client, database_stop_event)
-        )
-        
-        payments_thread.start()
-        database_thread.start()
+        threads = [
+            threading.Thread(target=generator, args=(client, threading.Event(), api))
+            for generator in rollouts.values()
+        ]
+        for thread in threads:
+            thread.start()
         
         logging.info("Guarded rollout generators are running...")
         logging.info("They will continue until measured rollouts complete.")
         
-        # Wait for both generators to complete
-        payments_thread.join()
-        database_thread.join()
+        # Wait for the generators to complete
+        for thread in threads:
+            thread.join()
         
         logging.info("All guarded rollout generators have completed.")
-        
-        logging.info("=" * 60)
-        logging.info("All results generation completed successfully!")
-        logging.info("=" * 60)
-        
+    
+    logging.info("=" * 60)
+    logging.info("All results generation completed successfully!")
+    logging.info("=" * 60)
+    return True
+
+def generate_results(project_key, api_key, scenarios=None, sdk_key=None):
+    """Main function to generate results with a client and session of its own. Returns True if it ran."""
+    logging.info(f"Generating results for project {project_key}: {', '.join(scenarios or SCENARIOS)}")
+    
+    sdk_key = sdk_key or os.getenv("LD_SDK_KEY")
+    if not sdk_key:
+        logging.error("LD_SDK_KEY not set in environment. Skipping results generation.")
+        return False
+    
+    client = create_client(sdk_key)
+    if client is None:
+        return False
+    
+    try:
+        return run_scenarios(client, RestAPI(project_key, api_key), scenarios)
     finally:
-        # Ensure all events are flushed before closing
-        logging.info("Performing final flush to ensure all events are sent...")
-        client.flush()
-        time.sleep(2)  # Wait for flush to complete
-        client.flush()  # Double flush to ensure all events are sent
-        time.sleep(1)  # Final wait
-        logging.info("Final flush completed. Closing client...")
-        client.close()
+        close_client(client)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate experiment and guarded rollout results for a ToggleStore project")
+    parser.add_argument(
+        "--scenarios",
+        default=os.getenv("LD_RESULTS_SCENARIOS"),
+        help="Comma separated scenarios to run, default all of: " + ", ".join(SCENARIOS),
+    )
+    args = parser.parse_args()
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()] if args.scenarios else None
+    unknown = sorted(set(scenarios or []) - set(SCENARIOS))
+    if unknown:
+        parser.error("unknown scenarios: " + ", ".join(unknown))
+
     PROJECT_KEY = os.getenv("LD_PROJECT_KEY")
     LD_API_KEY = os.getenv("LD_API_KEY")
     
@@ -614,5 +744,6 @@ if __name__ == "__main__":
         logging.error("LD_PROJECT_KEY and LD_API_KEY must be set in environment")
         exit(1)
     
-    generate_results(PROJECT_KEY, LD_API_KEY)
+    if not generate_results(PROJECT_KEY, LD_API_KEY, scenarios):
+        exit(1)
 
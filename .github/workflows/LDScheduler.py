@@ -0,0 +1,256 @@
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+DEFAULT_MAX_WORKERS = 8
+
+# The task running on the current worker thread
+context = threading.local()
+
+
+def current_task():
+    return getattr(context, "task", None)
+
+
+def current_phase():
+    task = current_task()
+    return task.phase if task is not None else None
+
+
+def in_current_task(fn):
+    """Wrap fn so that, run on another thread, its work counts towards the calling thread's task."""
+    task = current_task()
+
+    def run(*args, **kwargs):
+        previous = current_task()
+        context.task = task
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            context.task = previous
+
+    return run
+
+
+##################################################
+# A provisioning step
+##################################################
+class Task:
+    def __init__(self, name, fn, deps=(), phase=None, spec=None):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.phase = phase
+        # What the task sets up, e.g. the manifest entry it creates
+        self.spec = spec
+        # pending -> running -> done | failed, or pending -> skipped
+        self.status = "pending"
+        self.result = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def duration(self):
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+
+##################################################
+# Dependency graph of provisioning steps
+##################################################
+class TaskGraph:
+    """
+    Provisioning steps with explicit dependencies. run() starts every task
+    whose dependencies have completed on a worker pool, so a build takes as
+    long as its longest chain of dependent steps instead of the sum of all
+    of them. When a task fails its dependents are skipped and independent
+    branches carry on, e.g.
+
+        graph = TaskGraph(max_workers=8)
+        graph.add("project", create_project)
+        graph.add("metric:cart-total", create_cart_total, ["project"], phase="metrics")
+        graph.run()
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, verbose=True):
+        self.max_workers = max_workers
+        self.verbose = verbose
+        self.tasks = {}
+        self.lock = threading.Lock()
+        self.started_at = None
+        self.finished_at = None
+        # Called with each task that completes, from its worker thread
+        self.on_done = None
+        # Prefixed to progress and error output, e.g. the tenant being built
+        self.label = None
+
+    def add(self, name, fn, deps=(), phase=None, spec=None):
+        if name in self.tasks:
+            raise ValueError("Duplicate task: " + name)
+        self.tasks[name] = Task(name, fn, deps, phase if phase is not None else name, spec)
+        return name
+
+    def select(self, names):
+        """
+        Return a graph of just the named tasks. A task left out is treated as
+        done, and whatever it waited for is waited for by its dependents.
+        """
+        names = set(names)
+        graph = TaskGraph(self.max_workers, self.verbose)
+        graph.on_done = self.on_done
+        graph.label = self.label
+
+        def kept_deps(task, seen):
+            deps = []
+            for dep in task.deps:
+                if dep in seen:
+                    continue
+                seen.add(dep)
+                if dep in names:
+                    deps.append(dep)
+                else:
+                    deps += kept_deps(self.tasks[dep], seen)
+            return deps
+
+        for name, task in self.tasks.items():
+            if name in names:
+                graph.add(name, task.fn, kept_deps(task, set()), task.phase, task.spec)
+        return graph
+
+    def order(self):
+        """Return task names in dependency order. Raises ValueError on unknown deps or cycles."""
+        for task in self.tasks.values():
+            for dep in task.deps:
+                if dep not in self.tasks:
+                    raise ValueError(f"Task {task.name} depends on unknown task {dep}")
+        waiting = {name: set(task.deps) for name, task in self.tasks.items()}
+        ordered = []
+        ready = [name for name, deps in waiting.items() if not deps]
+        while ready:
+            name = ready.pop(0)
+            ordered.append(name)
+            del waiting[name]
+            for other, deps in waiting.items():
+                if name in deps:
+                    deps.discard(name)
+                    if not deps:
+                        ready.append(other)
+        if waiting:
+            raise ValueError("Dependency cycle between tasks: " + ", ".join(sorted(waiting)))
+        return ordered
+
+    ##################################################
+    # Running
+    ##################################################
+    def run(self):
+        """Run every task. Returns True if all of them completed."""
+        self.order()
+        waiting = {name: set(task.deps) for name, task in self.tasks.items()}
+        dependents = {name: [] for name in self.tasks}
+        for task in self.tasks.values():
+            for dep in task.deps:
+                dependents[dep].append(task.name)
+
+        self.started_at = time.time()
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ldbuild") as executor:
+            while True:
+                for name in [name for name, deps in waiting.items() if not deps]:
+                    del waiting[name]
+                    task = self.tasks[name]
+                    running[executor.submit(self.execute, task)] = task
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    if task.status == "done":
+                        for name in dependents[task.name]:
+                            # Dependents of a failed task are no longer waiting
+                            if name in waiting:
+                                waiting[name].discard(task.name)
+                    else:
+                        self.skip_dependents(task.name, waiting, dependents)
+        self.finished_at = time.time()
+        return all(task.status == "done" for task in self.tasks.values())
+
+    def execute(self, task):
+        context.task = task
+        task.status = "running"
+        task.started_at = time.time()
+        try:
+            task.result = task.fn()
+            task.status = "done"
+            if self.on_done is not None:
+                self.on_done(task)
+        except Exception as e:
+            task.error = e
+            task.status = "failed"
+            with self.lock:
+                print(f"{self.prefix()}Error in {task.name}: {e}")
+                traceback.print_exc()
+        finally:
+            task.finished_at = time.time()
+            context.task = None
+        if self.verbose and task.status == "done":
+            with self.lock:
+                print(f"  {self.prefix()}[{task.phase}] {task.name} ({task.duration:.1f}s)")
+
+    def skip_dependents(self, name, waiting, dependents):
+        for dependent in dependents[name]:
+            if dependent in waiting:
+                del waiting[dependent]
+                self.tasks[dependent].status = "skipped"
+                print(f"{self.prefix()}Skipping {dependent}: {name} did not complete")
+                self.skip_dependents(dependent, waiting, dependents)
+
+    ##################################################
+    # Reporting
+    ##################################################
+    def prefix(self):
+        return f"[{self.label}] " if self.label else ""
+
+    def progress(self):
+        """Return {status: number of tasks}."""
+        counts = {}
+        for task in list(self.tasks.values()):
+            counts[task.status] = counts.get(task.status, 0) + 1
+        return counts
+
+    def critical_path(self):
+        """Return (task names, seconds) of the slowest chain of dependent tasks in the last run."""
+        finish = {}
+        previous = {}
+        for name in self.order():
+            task = self.tasks[name]
+            start = 0.0
+            previous[name] = None
+            for dep in task.deps:
+                if finish[dep] > start:
+                    start = finish[dep]
+                    previous[name] = dep
+            finish[name] = start + task.duration
+        if not finish:
+            return [], 0.0
+        name = max(finish, key=finish.get)
+        total = finish[name]
+        path = []
+        while name is not None:
+            path.append(name)
+            name = previous[name]
+        return list(reversed(path)), total
+
+    def phase_times(self):
+        """Return {phase: (first start, last finish)} relative to the start of the run."""
+        phases = {}
+        for task in self.tasks.values():
+            if task.started_at is None:
+                continue
+            start = task.started_at - self.started_at
+            end = task.finished_at - self.started_at
+            first, last = phases.get(task.phase, (start, end))
+            phases[task.phase] = (min(first, start), max(last, end))
+        return phases
@@ -0,0 +1,407 @@
+import fnmatch
+import random
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+
+# Path segments that name an API collection or action. Every other segment is
+# a project, environment or resource key and is collapsed to "*" so that all
+# calls hitting the same API route share one rate limit bucket.
+ROUTE_SEGMENTS = {
+    "api",
+    "v2",
+    "projects",
+    "environments",
+    "flags",
+    "segments",
+    "metrics",
+    "metric-groups",
+    "experiments",
+    "experimentation-settings",
+    "holdouts",
+    "layers",
+    "release-pipelines",
+    "release",
+    "phases",
+    "measured-rollout-configuration",
+    "copy",
+    "context-kinds",
+    "ai-configs",
+    "model-configs",
+    "variations",
+    "targeting",
+    "members",
+    "shortcuts",
+    "alerts",
+}
+
+
+def route_key(method, url):
+    """
+    Return the rate limit route for a request, e.g.
+    "PATCH /api/v2/flags/*/*" for any semantic patch on a flag.
+    """
+    path = urlparse(url).path.strip("/")
+    parts = [p if p in ROUTE_SEGMENTS else "*" for p in path.split("/") if p]
+    return method.upper() + " /" + "/".join(parts)
+
+
+##################################################
+# Token bucket for a single API route
+##################################################
+class TokenBucket:
+    """
+    Budget for one route, learned from the X-Ratelimit-Route-Remaining and
+    X-Ratelimit-Reset response headers. The API refills a route's budget at
+    the reset time, so the bucket refills to its learned capacity once the
+    reset time has passed.
+    """
+
+    def __init__(self):
+        self.capacity = None
+        self.tokens = None
+        self.reset_at = 0.0
+
+    def take(self, now, reserve):
+        """Take a token. Returns 0 on success, otherwise the seconds to wait."""
+        if self.tokens is None:
+            # Budget not learned yet, the first response will tell us
+            return 0
+        if now >= self.reset_at:
+            # The window has reset. Assume the full budget until a response
+            # from the new window reports the real reset time.
+            self.tokens = self.capacity
+            self.reset_at = now + 1.0
+        if self.tokens > reserve:
+            self.tokens -= 1
+            return 0
+        return max(self.reset_at - now, 0.05)
+
+    def observe(self, remaining, reset_at):
+        if self.capacity is None or remaining + 1 > self.capacity:
+            self.capacity = remaining + 1
+        if self.tokens is None or reset_at > self.reset_at:
+            # First response, or a new rate limit window has started
+            self.tokens = remaining
+            self.reset_at = reset_at
+        else:
+            # Same window: the server count is authoritative, but requests we
+            # have already let through may not be reflected in it yet
+            self.tokens = min(self.tokens, remaining)
+
+
+##################################################
+# Per-route rate limiter shared across threads
+##################################################
+class RateLimiter:
+    """
+    Holds one TokenBucket per route and makes callers wait, before a request
+    is sent, only as long as needed for the route's budget to reset. Safe to
+    share between threads and between LDPlatform instances using the same
+    API key.
+    """
+
+    def __init__(self, reserve=1):
+        # Tokens left untouched in every window, as headroom for other
+        # clients using the same access token
+        self.reserve = reserve
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.sleep_time = 0.0
+
+    def acquire(self, route):
+        """Block until a request on route may be sent. Returns seconds waited."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                bucket = self.buckets.setdefault(route, TokenBucket())
+                delay = bucket.take(time.time(), self.reserve)
+                if delay <= 0:
+                    self.sleep_time += waited
+                    return waited
+            time.sleep(delay)
+            waited += delay
+
+    def update(self, route, headers):
+        """Learn the route's budget from the rate limit headers of a response."""
+        if "X-Ratelimit-Route-Remaining" not in headers:
+            return
+        try:
+            remaining = int(headers["X-Ratelimit-Route-Remaining"])
+        except ValueError:
+            return
+        now = time.time()
+        reset_at = now + 1
+        if "X-Ratelimit-Reset" in headers:
+            try:
+                reset_at = int(headers["X-Ratelimit-Reset"]) / 1000.0
+            except ValueError:
+                pass
+        with self.lock:
+            self.buckets.setdefault(route, TokenBucket()).observe(remaining, reset_at)
+
+
+##################################################
+# Retry policy
+##################################################
+
+# Statuses worth retrying: rate limited, or a transient server-side failure
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Verbs that can be replayed without changing the outcome
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class RetryPolicy:
+    """
+    Decides whether a failed request is retried and how long to wait first.
+
+    A 429 was rejected before the server did anything, so it is retried for
+    every verb. Server errors and connection failures are only retried for
+    idempotent verbs, or when the caller marks a PATCH/POST as safe to replay.
+    Waits honor Retry-After (or X-Ratelimit-Reset on a 429) and otherwise use
+    capped exponential backoff with jitter.
+
+    routes maps fnmatch patterns over route keys (see route_key) to overrides
+    of any constructor argument, e.g.
+    {"PUT /api/v2/projects/*/flags/*/release/phases/*": {"statuses": {409}}}.
+    """
+
+    def __init__(
+        self,
+        max_retries=4,
+        base_delay=0.5,
+        max_delay=15.0,
+        statuses=RETRY_STATUSES,
+        methods=IDEMPOTENT_METHODS,
+        routes=None,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.statuses = set(statuses)
+        self.methods = set(methods)
+        self.routes = routes or {}
+
+    def for_route(self, route):
+        """Return the policy to use for route, with any matching overrides applied."""
+        for pattern, overrides in self.routes.items():
+            if fnmatch.fnmatchcase(route, pattern):
+                settings = {
+                    "max_retries": self.max_retries,
+                    "base_delay": self.base_delay,
+                    "max_delay": self.max_delay,
+                    "statuses": self.statuses,
+                    "methods": self.methods,
+                }
+                settings.update(overrides)
+                return RetryPolicy(**settings)
+        return self
+
+    def is_idempotent(self, method, idempotent=None):
+        if idempotent is not None:
+            return idempotent
+        return method.upper() in self.methods
+
+    def should_retry(self, method, status_code, attempt, idempotent=None):
+        if attempt >= self.max_retries or status_code not in self.statuses:
+            return False
+        if status_code == 429:
+            return True
+        return self.is_idempotent(method, idempotent)
+
+    def should_retry_error(self, method, attempt, idempotent=None):
+        if attempt >= self.max_retries:
+            return False
+        return self.is_idempotent(method, idempotent)
+
+    def backoff(self, attempt):
+        """Capped exponential backoff with equal jitter."""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def delay(self, attempt, response=None):
+        """Seconds to wait before retry number attempt + 1."""
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return retry_after
+            if response.status_code == 429 and "X-Ratelimit-Reset" in response.headers:
+                try:
+                    reset_at = int(response.headers["X-Ratelimit-Reset"]) / 1000.0
+                    return max(reset_at - time.time(), 0) + random.uniform(0, self.base_delay)
+                except ValueError:
+                    pass
+        return self.backoff(attempt)
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header given as seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+
+##################################################
+# Read-through response cache
+##################################################
+class ResponseCache:
+    """
+    TTL + LRU cache of successful GET responses, keyed by URL and API
+    version. Writes invalidate every entry for the written resource, its
+    sub-resources and the collections above it, so a PATCH on a flag drops
+    both the flag document and any cached flag list.
+
+    Expired entries are kept until evicted so that, when the response carried
+    an ETag, the next GET can be sent as a conditional request and a 304
+    revalidates the cached response instead of downloading it again.
+    """
+
+    def __init__(self, ttl=30.0, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        # Bumped on every invalidation, so a GET that was in flight while a
+        # write landed does not store the pre-write response
+        self.generation = 0
+
+    @staticmethod
+    def key(url, headers=None):
+        version = (headers or {}).get("LD-API-Version", "")
+        return (url, version)
+
+    def get(self, url, headers=None):
+        """Return the cached response for url, or None if missing or expired."""
+        key = self.key(url, headers)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.time() - entry["stored_at"] > self.ttl:
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry["response"]
+
+    def etag(self, url, headers=None):
+        """Return the ETag of the cached (possibly expired) response for url, if any."""
+        with self.lock:
+            entry = self.entries.get(self.key(url, headers))
+            return entry["etag"] if entry is not None else None
+
+    def revalidate(self, url, headers=None):
+        """The server answered 304: mark the cached response fresh and return it."""
+        key = self.key(url, headers)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            entry["stored_at"] = time.time()
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.revalidations += 1
+            return entry["response"]
+
+    def record_miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def put(self, url, response, headers=None, generation=None):
+        key = self.key(url, headers)
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = {
+                "response": response,
+                "etag": response.headers.get("ETag"),
+                "stored_at": time.time(),
+            }
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, url):
+        """Drop entries for url's resource, its sub-resources and its parent collections."""
+        written = urlparse(url).path.rstrip("/")
+        with self.lock:
+            self.generation += 1
+            for key in list(self.entries):
+                cached = urlparse(key[0]).path.rstrip("/")
+                if (
+                    cached == written
+                    or cached.startswith(written + "/")
+                    or written.startswith(cached + "/")
+                ):
+                    del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "entries": len(self.entries),
+            }
+
+
+##################################################
+# Single-flight coalescing of identical requests
+##################################################
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers arriving while a call
+    for the same key is in flight wait for it and get its result (or its
+    exception) instead of sending a duplicate request.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self.calls[key] = call
+            else:
+                self.shared += 1
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fn()
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call["done"].set()
+        return call["result"]
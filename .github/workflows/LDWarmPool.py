@@ -0,0 +1,274 @@
+import LDCatalog
+import LDJournal
+import LDManifest
+import LDMultiTenantBuilder
+import LDPlatform
+import argparse
+import json
+import os
+import random
+import time
+import randomname
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Idle, fully built projects carry POOL_TAG. Claiming one replaces it with
+# the owner tag of the namespace it was claimed for
+POOL_TAG = "togglestore-pool"
+OWNER_TAG_PREFIX = "togglestore-owner-"
+
+DEFAULT_POOL_TARGET = 3
+
+# Pool namespaces are "pool-<unix time>-<name>", so a project whose refill
+# was interrupted before it was tagged can be told apart and aged
+NAMESPACE_PREFIX = "pool-"
+# Untagged pool projects older than this were left by an interrupted refill
+ABANDONED_AFTER = 3600
+# Appended to a namespace to make its project key
+PROJECT_SUFFIX = "-togglestore"
+
+
+def owner_tag(namespace):
+    return OWNER_TAG_PREFIX + namespace
+
+
+def pool_namespace():
+    return f"{NAMESPACE_PREFIX}{int(time.time())}-{randomname.get_name()}"
+
+
+def pool_project_name(project_key):
+    """The name a refill builds project_key with, before it is claimed."""
+    return "ToggleStore - " + project_key[:-len(PROJECT_SUFFIX)]
+
+
+def pool_created_at(project_key):
+    """When the refill that built project_key started, or None if it is not a pool project."""
+    if not project_key.startswith(NAMESPACE_PREFIX):
+        return None
+    started = project_key[len(NAMESPACE_PREFIX):].split("-", 1)[0]
+    return int(started) if started.isdigit() else None
+
+
+##################################################
+# Pre-built ToggleStore projects
+##################################################
+class WarmPool:
+    """
+    Keeps target idle ToggleStore projects built ahead of time, so a deploy
+    claims one with a handful of calls instead of building its own.
+    Projects are built by ToggleStoreBuilder like any other, and only
+    tagged into the pool once every build step has completed.
+    """
+
+    def __init__(
+        self,
+        api_key,
+        api_key_user,
+        target=DEFAULT_POOL_TARGET,
+        manifest=None,
+        journal_dir=LDJournal.DEFAULT_DIRECTORY,
+    ):
+        self.api_key = api_key
+        self.api_key_user = api_key_user
+        self.target = target
+        self.manifest = manifest if manifest is not None else LDManifest.Manifest.load()
+        self.journal_dir = journal_dir
+        self.member_directory = LDCatalog.MemberDirectory()
+        # Pool bookkeeping needs no maintainer
+        self.ldproject = LDPlatform.LDPlatform(api_key, api_key_user, None, member_directory=self.member_directory)
+
+    def idle_projects(self):
+        return self.ldproject.list_projects(POOL_TAG)
+
+    def owned_project(self, namespace):
+        """The project claimed for namespace earlier, if any."""
+        projects = self.ldproject.list_projects(owner_tag(namespace))
+        return projects[0] if projects else None
+
+    ##################################################
+    # Claim
+    ##################################################
+    def claim(self, namespace):
+        """
+        Take an idle project for namespace. Returns the platform of the
+        claimed project, with its SDK key and client-side ID, or None when
+        the pool is empty.
+        """
+        candidates = self.idle_projects()
+        # Deploys claiming at the same time start from different projects
+        random.shuffle(candidates)
+        for project in candidates:
+            # The test fails if another deploy claimed the project since it
+            # was listed, and then nothing is changed
+            res = self.ldproject.patch_project(project["key"], [
+                {"op": "test", "path": "/tags", "value": project.get("tags", [])},
+                {"op": "replace", "path": "/name", "value": f"ToggleStore - {namespace}"},
+                {"op": "replace", "path": "/tags", "value": [owner_tag(namespace)]},
+            ])
+            if res.status_code == 200:
+                print(f"Claimed project {project['key']}")
+                return self.take_over(project["key"], namespace)
+        return None
+
+    def take_over(self, project_key, namespace):
+        """Make the namespace's member the maintainer of the project's flags, metrics and AI configs."""
+        platform = LDPlatform.LDPlatform(
+            self.api_key,
+            self.api_key_user,
+            namespace + "@launchdarkly.com",
+            member_directory=self.member_directory,
+        )
+        platform.project_key = project_key
+        platform.assign_maintainers(
+            flags=sorted(self.manifest.flag_keys()),
+            metrics=sorted(self.manifest.metric_keys()),
+            ai_configs=sorted(self.manifest.ai_config_keys()),
+        )
+        platform.get_environment_keys("production")
+        return platform
+
+    ##################################################
+    # Refill
+    ##################################################
+    def refill(self, max_tenants=LDMultiTenantBuilder.DEFAULT_MAX_TENANTS):
+        """Build projects until the pool has target idle ones. Returns how many were added."""
+        self.remove_abandoned()
+        missing = self.target - len(self.idle_projects())
+        if missing <= 0:
+            print(f"Pool has {self.target} idle projects or more")
+            return 0
+        print(f"Building {missing} projects for the pool...")
+        builder = LDMultiTenantBuilder.MultiTenantBuilder(
+            self.api_key,
+            self.api_key_user,
+            [pool_namespace() for _ in range(missing)],
+            max_tenants=max_tenants,
+            manifest=self.manifest,
+            journal_dir=self.journal_dir,
+            # Nobody looks at an idle project's results, and by the time it
+            # is claimed they would be stale
+            generate_results=False,
+        )
+        builder.run()
+        added = 0
+        for tenant in builder.tenants:
+            if tenant.builder is None:
+                continue
+            if tenant.status == "done":
+                res = self.ldproject.patch_project(tenant.project_key, [
+                    {"op": "replace", "path": "/tags", "value": [POOL_TAG]},
+                ])
+                if res.status_code == 200:
+                    added += 1
+                    continue
+            # A project that is not fully built is never claimed
+            print(f"Removing unfinished pool project {tenant.project_key}")
+            tenant.builder.ldproject.delete_project()
+        print(f"Added {added} projects to the pool")
+        return added
+
+    def remove_abandoned(self, max_age=ABANDONED_AFTER):
+        """
+        Delete pool projects that were neither tagged into the pool nor
+        claimed, and are older than max_age: a refill that was stopped part
+        way leaves its projects behind before it can tag or delete them.
+        Returns how many were deleted.
+        """
+        removed = 0
+        for project in self.ldproject.list_projects(query=NAMESPACE_PREFIX):
+            created_at = pool_created_at(project["key"])
+            if created_at is None or project.get("tags"):
+                continue
+            # Claiming renames a project for its namespace, so one that has
+            # lost its owner tag is still never taken for abandoned
+            if project.get("name") != pool_project_name(project["key"]):
+                continue
+            if time.time() - created_at < max_age:
+                continue
+            print(f"Removing abandoned pool project {project['key']}")
+            self.ldproject.project_key = project["key"]
+            self.ldproject.delete_project()
+            removed += 1
+        return removed
+
+
+def write_github_file(variable, values):
+    path = os.getenv(variable)
+    if not path:
+        print(f"{variable} not set")
+        return
+    try:
+        with open(path, "a") as f:
+            for name, value in values.items():
+                f.write(f"{name}={value}\n")
+    except IOError as e:
+        print(f"Unable to write to {variable}: {e}")
+
+
+############################################################################################################
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Manage the pool of pre-built ToggleStore projects")
+    parser.add_argument(
+        "command",
+        choices=["claim", "refill", "status"],
+        help="claim a project for DEMO_NAMESPACE, refill the pool, or list the idle projects",
+    )
+    parser.add_argument(
+        "--target",
+        type=int,
+        default=int(os.getenv("LD_WARM_POOL_SIZE", DEFAULT_POOL_TARGET)),
+        help="Idle projects to keep ready",
+    )
+    parser.add_argument("--manifest", default=os.getenv("LD_MANIFEST", LDManifest.DEFAULT_MANIFEST))
+    args = parser.parse_args()
+
+    LD_API_KEY = os.getenv("LD_API_KEY")
+    LD_API_KEY_USER = os.getenv("LD_API_KEY_USER")
+    DEMO_NAMESPACE = os.getenv("DEMO_NAMESPACE")
+    LD_JOURNAL_DIR = os.getenv("LD_JOURNAL_DIR", LDJournal.DEFAULT_DIRECTORY)
+
+    pool = WarmPool(
+        LD_API_KEY, LD_API_KEY_USER, target=args.target,
+        manifest=LDManifest.Manifest.load(args.manifest), journal_dir=LD_JOURNAL_DIR)
+
+    if args.command == "status":
+        print(json.dumps([project["key"] for project in pool.idle_projects()], indent=2))
+    elif args.command == "refill":
+        pool.refill()
+    else:
+        if not DEMO_NAMESPACE:
+            parser.error("DEMO_NAMESPACE must be set to claim a project")
+        # A namespace that already has a project keeps it, and the builder
+        # reconciles it as usual
+        project_key = DEMO_NAMESPACE + "-togglestore"
+        claimed = None
+        owned = None
+        if pool.ldproject.project_exists(project_key):
+            print(f"Namespace {DEMO_NAMESPACE} already has project {project_key}")
+        else:
+            owned = pool.owned_project(DEMO_NAMESPACE)
+            if owned is not None:
+                project_key = owned["key"]
+                print(f"Namespace {DEMO_NAMESPACE} already has pool project {project_key}")
+            else:
+                # The pool is refilled by the warm pool workflow, which the
+                # deploy starts after a claim
+                claimed = pool.claim(DEMO_NAMESPACE)
+                if claimed is None:
+                    print("No idle project in the pool, the project will be built")
+        if claimed is not None:
+            project_key = claimed.project_key
+            write_github_file("GITHUB_ENV", {
+                "LD_SDK_KEY": claimed.sdk_key,
+                "LD_CLIENT_KEY": claimed.client_id,
+                "LD_PROJECT_KEY": project_key,
+                "Project_Created": True,
+            })
+        write_github_file("GITHUB_OUTPUT", {
+            "project_key": project_key,
+            "claimed": str(claimed is not None).lower(),
+        })